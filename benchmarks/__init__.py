@@ -0,0 +1,46 @@
+"""Benchmarks for the polls app.
+
+Run a benchmark from the project directory, for example::
+
+    python -m benchmarks.sqlite_profile --help
+
+Each benchmark works on its own temporary SQLite database, never on db.sqlite3, and
+writes its audit log next to it, never to the production log.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+
+def setup_django():
+    """Load the project settings and the apps."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    import django
+    django.setup()
+
+
+def use_temporary_database(directory=None, name='bench.sqlite3'):
+    """
+    Point the default database at a new SQLite file and migrate it.
+
+    The audit log is written to the same directory.
+
+    Arguments:
+        directory: where to create the file, a new temporary directory if None.
+        name: the file name of the database.
+
+    Returns:
+        Path: the path of the database file.
+    """
+    from django.core.management import call_command
+    from django.db import connections
+
+    from polls.audit import use_audit_log
+
+    directory = Path(directory or tempfile.mkdtemp(prefix='ku-polls-bench-'))
+    path = directory / name
+    connections.close_all()
+    connections.databases['default']['NAME'] = str(path)
+    use_audit_log(directory / 'audit.log')
+    call_command('migrate', verbosity=0)
+    return path
@@ -0,0 +1,203 @@
+"""Load test the polls endpoints through the Django test client.
+
+Usage::
+
+    python -m benchmarks.endpoints --questions 200 --choices 5 --users 500 --votes 20000 \\
+        --requests 500 --concurrency 1 8 --output bench.json
+    python -m benchmarks.endpoints ... --baseline bench.json
+
+A fresh temporary database is seeded with N questions of M choices, U users and V votes.
+Then index_view, detail_view, ResultsView and vote are each driven from several threads,
+every thread with its own logged in client. For every endpoint and concurrency level the
+run reports latency percentiles, requests per second and database queries per request.
+With --output the report is written as JSON, and --baseline compares against such a file.
+"""
+import argparse
+import datetime
+import json
+import random
+import subprocess
+import threading
+import time
+
+from benchmarks import setup_django, use_temporary_database
+
+ENDPOINTS = ('index', 'detail', 'results', 'vote')
+
+
+def seed(questions, choices, users, votes, rng):
+    """
+    Fill the database with the benchmark dataset.
+
+    Returns:
+        tuple: the user ids and a dict of question id to its choice ids.
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from polls.models import Question, Choice, Vote
+
+    now = timezone.now()
+    Question.objects.bulk_create(
+        Question(question_text=f"Question {i}", pub_date=now - datetime.timedelta(days=1, minutes=i),
+                 end_date=now + datetime.timedelta(days=30)) for i in range(questions))
+    Choice.objects.bulk_create(Choice(question=question, choice_text=f"Choice {i}")
+                               for question in Question.objects.all() for i in range(choices))
+    User.objects.bulk_create(User(username=f"voter{i}") for i in range(users))
+    user_ids = list(User.objects.values_list('id', flat=True))
+    question_choices = {}
+    for question_id, choice_id in Choice.objects.values_list('question_id', 'id'):
+        question_choices.setdefault(question_id, []).append(choice_id)
+    question_ids = list(question_choices)
+    ballots = {}
+    for _ in range(votes):
+        question_id = rng.choice(question_ids)
+        ballots[(rng.choice(user_ids), question_id)] = rng.choice(question_choices[question_id])
+    items = list(ballots.items())
+    for start in range(0, len(items), 500):
+        Vote.objects.cast_many(dict(items[start:start + 500]))
+    return user_ids, question_choices
+
+
+def percentile(values, fraction):
+    """Get the value below which the given fraction of the sorted values fall."""
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def drive(endpoint, requests, concurrency, user_ids, question_choices, rng):
+    """
+    Send `requests` requests to one endpoint from `concurrency` threads.
+
+    Returns:
+        dict: the latency percentiles in milliseconds, requests per second, mean queries
+        per request and the number of responses with an error status.
+    """
+    from django.db import connection, connections
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.contrib.auth.models import User
+
+    question_ids = list(question_choices)
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(count, user_id, worker_rng):
+        client = Client()
+        client.force_login(User.objects.get(pk=user_id))
+        mine_latency, mine_queries, mine_errors = [], [], 0
+        for _ in range(count):
+            question_id = worker_rng.choice(question_ids)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                if endpoint == 'index':
+                    response = client.get('/polls/')
+                elif endpoint == 'detail':
+                    response = client.get(f'/polls/{question_id}/')
+                elif endpoint == 'results':
+                    response = client.get(f'/polls/{question_id}/results/')
+                else:
+                    response = client.post(f'/polls/{question_id}/vote/',
+                                           {'choice': worker_rng.choice(question_choices[question_id])})
+                mine_latency.append(time.perf_counter() - start)
+            mine_queries.append(len(captured))
+            mine_errors += response.status_code >= 400
+        connections.close_all()
+        with lock:
+            latencies.extend(mine_latency)
+            queries.extend(mine_queries)
+            errors.append(mine_errors)
+
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    workers = [threading.Thread(target=worker, args=(count, rng.choice(user_ids), random.Random(rng.random())))
+               for count in counts]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+def git_revision():
+    """Get the commit the benchmark ran on, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the change of each result against the same endpoint and concurrency in a baseline."""
+    previous = {(row['endpoint'], row['concurrency']): row for row in baseline['results']}
+    print(f"\nAgainst {baseline.get('revision') or 'baseline'}:")
+    for row in results:
+        old = previous.get((row['endpoint'], row['concurrency']))
+        if old is None:
+            continue
+        print(f"{row['endpoint']:>8} x{row['concurrency']:<3} "
+              f"p95 {old['p95_ms']:>8} -> {row['p95_ms']:<8} ms  "
+              f"rps {old['requests_per_second']:>8} -> {row['requests_per_second']:<8}  "
+              f"queries {old['queries_per_request']} -> {row['queries_per_request']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--votes', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=300, help="requests per endpoint and concurrency level")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    # Every thread votes far faster than a person, so the vote rate limits would refuse most votes.
+    settings.POLLS_RATE_LIMITS = {}
+    rng = random.Random(args.seed)
+    use_temporary_database()
+    user_ids, question_choices = seed(args.questions, args.choices, args.users, args.votes, rng)
+    results = []
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            row = drive(endpoint, args.requests, concurrency, user_ids, question_choices, rng)
+            results.append(row)
+            print(f"{endpoint:>8} x{concurrency:<3} p50 {row['p50_ms']:>8} ms  p95 {row['p95_ms']:>8} ms  "
+                  f"p99 {row['p99_ms']:>8} ms  {row['requests_per_second']:>8} req/s  "
+                  f"{row['queries_per_request']:>6} queries/req  {row['errors']} errors")
+    report = {
+        'revision': git_revision(),
+        'dataset': {'questions': args.questions, 'choices': args.choices, 'users': args.users, 'votes': args.votes},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Compare vote throughput with and without the SQLite profile.
+
+Usage::
+
+    python -m benchmarks.sqlite_profile --threads 1 4 8 --votes 500
+
+For each thread count the same random votes are cast through Vote.objects.cast on a
+fresh database, once with SQLite defaults and once with the pragmas and persistent
+connections of SQLITE_PROFILE, taken from the settings. Every vote is wrapped in the
+same connection handling Django does around a request.
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks import setup_django, use_temporary_database
+
+def seed(questions, choices, users):
+    """Create the questions, choices and users to vote with."""
+    import datetime
+
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from polls.models import Question, Choice
+
+    now = timezone.now()
+    Question.objects.bulk_create(Question(question_text=f"Question {i}", pub_date=now - datetime.timedelta(days=1),
+                                          end_date=now + datetime.timedelta(days=1)) for i in range(questions))
+    Choice.objects.bulk_create(Choice(question=question, choice_text=f"Choice {i}")
+                               for question in Question.objects.all() for i in range(choices))
+    User.objects.bulk_create(User(username=f"voter{i}") for i in range(users))
+    question_choices = {}
+    for question_id, choice_id in Choice.objects.values_list('question_id', 'id'):
+        question_choices.setdefault(question_id, []).append(choice_id)
+    return list(User.objects.values_list('id', flat=True)), question_choices
+
+
+def run(threads, votes, user_ids, question_choices, rng):
+    """
+    Cast `votes` random votes spread over `threads` threads.
+
+    Returns:
+        dict: votes per second and the number of votes that failed.
+    """
+    from django.db import close_old_connections, connections, OperationalError
+
+    from polls.models import Vote
+
+    plan = []
+    for _ in range(votes):
+        question_id = rng.choice(list(question_choices))
+        plan.append((rng.choice(user_ids), question_id, rng.choice(question_choices[question_id])))
+    failures = []
+
+    def worker(chunk):
+        for user_id, question_id, choice_id in chunk:
+            close_old_connections()
+            try:
+                Vote.objects.cast(user_id, question_id, choice_id)
+            except OperationalError as error:
+                failures.append(str(error))
+            close_old_connections()
+        connections.close_all()
+
+    workers = [threading.Thread(target=worker, args=(plan[i::threads],)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {'votes_per_second': round(votes / elapsed, 1), 'failed': len(failures)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--votes', type=int, default=1000, help="votes cast per run")
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connections
+    from django.test.utils import override_settings
+
+    profiles = (('default', {}, 0),
+                ('sqlite_profile', settings.POLLS_SQLITE_PROFILE_PRAGMAS, settings.SQLITE_PROFILE_CONN_MAX_AGE))
+    results = []
+    directory = tempfile.mkdtemp(prefix='ku-polls-bench-')
+    for profile, pragmas, conn_max_age in profiles:
+        for threads in args.threads:
+            with override_settings(POLLS_SQLITE_PRAGMAS=pragmas):
+                use_temporary_database(directory, f'{profile}-{threads}.sqlite3')
+                connections.databases['default']['CONN_MAX_AGE'] = conn_max_age
+                user_ids, question_choices = seed(args.questions, args.choices, args.users)
+                connections.close_all()
+                result = run(threads, args.votes, user_ids, question_choices, random.Random(args.seed))
+            results.append({'profile': profile, 'threads': threads, **result})
+            print(f"{profile:>15} {threads:>3} threads: {result['votes_per_second']:>9} votes/s, "
+                  f"{result['failed']} failed")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
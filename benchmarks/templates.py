@@ -0,0 +1,80 @@
+"""Time the rendering of the poll index list for many questions.
+
+Usage::
+
+    python -m benchmarks.templates --questions 1000 --repeat 50
+
+Renders the question list of the index for N unsaved questions, no database needed,
+and reports the mean time per render in milliseconds of:
+
+* loading the template through the plain loaders, which read and parse it each time,
+  and through the cached loader;
+* rendering the list with {% url %} reversed twice per question, as the template did
+  before, and with the URLs built from one reversed prefix, as it does now.
+"""
+import argparse
+import datetime
+import time
+
+from benchmarks import setup_django
+
+PER_ROW_URLS = """
+<ul>
+{% for question in question_list %}
+    <li><a href="{% url 'polls:detail' question.id %}">{{ question.question_text }}</a></li>
+    <a href="{% url 'polls:results' question.id %}">Result</a>
+{% endfor %}
+</ul>
+"""
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def mean_ms(function, repeat):
+    """Run `function` `repeat` times and give the mean time of a run in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.template import Context, Engine
+    from django.utils import timezone
+
+    from polls.models import Question
+
+    now = timezone.now()
+    questions = [Question(pk=i, question_text=f"Question {i}", pub_date=now - datetime.timedelta(minutes=i),
+                          end_date=now + datetime.timedelta(days=1)) for i in range(1, args.questions + 1)]
+    context = Context({'question_list': questions})
+    name = 'polls/question_list.html'
+    plain = Engine(dirs=settings.TEMPLATES[0]['DIRS'], loaders=LOADERS)
+    cached = Engine(dirs=settings.TEMPLATES[0]['DIRS'], loaders=[('django.template.loaders.cached.Loader', LOADERS)])
+    cached.get_template(name)
+    per_row = plain.from_string(PER_ROW_URLS)
+    prefixed = cached.get_template(name)
+
+    rows = [
+        ('load, plain loaders', mean_ms(lambda: plain.get_template(name), args.repeat)),
+        ('load, cached loader', mean_ms(lambda: cached.get_template(name), args.repeat)),
+        ('render, {% url %} per row', mean_ms(lambda: per_row.render(context), args.repeat)),
+        ('render, one reversed prefix', mean_ms(lambda: prefixed.render(context), args.repeat)),
+    ]
+    print(f"{args.questions} questions, mean of {args.repeat} runs")
+    for label, ms in rows:
+        print(f"{label:<30} {ms:>10.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from polls.streams import stream_router  # noqa: E402  (needs the apps loaded by get_asgi_application)
+
+application = stream_router(django_application)
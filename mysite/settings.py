@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/3.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 import os
 
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'polls.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,11 +56,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'mysite.urls'
 
+# With POLLS_TEMPLATE_CACHE, on by default unless DEBUG, templates are read and compiled
+# once per process by the cached loader, and the polls templates are compiled at startup.
+POLLS_TEMPLATE_CACHE = config("POLLS_TEMPLATE_CACHE", default=not DEBUG, cast=bool)
+
+template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'polls.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -67,6 +76,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [('django.template.loaders.cached.Loader', template_loaders)]
+            if POLLS_TEMPLATE_CACHE else template_loaders,
         },
     },
 ]
@@ -77,13 +88,144 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# SQLITE_PROFILE turns on WAL journaling and the pragmas below for every connection,
+# and keeps connections open across requests. benchmarks/sqlite_profile.py measures the
+# same POLLS_SQLITE_PROFILE_PRAGMAS and SQLITE_PROFILE_CONN_MAX_AGE.
+SQLITE_PROFILE = config("SQLITE_PROFILE", default=False, cast=bool)
+SQLITE_PROFILE_CONN_MAX_AGE = 600
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': config("CONN_MAX_AGE", default=SQLITE_PROFILE_CONN_MAX_AGE if SQLITE_PROFILE else 0, cast=int),
     }
 }
 
+# Read replicas: a comma separated list of database files, kept up to date from the primary
+# by replication, or locally by the sync_replicas command. Views that only read send the
+# queries of the polls app to a random replica, unless the user wrote within the last
+# POLLS_REPLICA_PIN_SECONDS seconds. Writes, sessions and users always use the primary.
+DATABASE_REPLICAS = config("DATABASE_REPLICAS", default='', cast=Csv())
+POLLS_REPLICAS = []
+for number, name in enumerate(DATABASE_REPLICAS, 1):
+    POLLS_REPLICAS.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'NAME': BASE_DIR / name, 'TEST': {'MIRROR': 'default'}}
+POLLS_REPLICA_APPS = ['polls']
+POLLS_REPLICA_PIN_SECONDS = config("POLLS_REPLICA_PIN_SECONDS", default=10, cast=int)
+
+# Vote shards: a comma separated list of database files that hold the votes and vote rollups,
+# each question on one of them by a hash of its id. Migrate each one with
+# `manage.py migrate --database votesN`, which only creates the vote tables, and move the
+# votes with the rebalance_votes command after changing the list. Append new shards at the
+# end: the hash is of the alias, so renumbering the shards moves most questions. With
+# shards, results and the vote counts of the index JSON, the admin and export_polls are
+# summed from the rollups of the shard of the question, and the vote_count columns on the
+# primary are only refreshed by the rebuild_tallies command. The vote tables on the shards
+# have no foreign key constraints; those on the primary keep them.
+DATABASE_VOTE_SHARDS = config("DATABASE_VOTE_SHARDS", default='', cast=Csv())
+POLLS_VOTE_SHARDS = []
+for number, name in enumerate(DATABASE_VOTE_SHARDS, 1):
+    POLLS_VOTE_SHARDS.append(f'votes{number}')
+    DATABASES[f'votes{number}'] = {**DATABASES['default'], 'NAME': BASE_DIR / name}
+DATABASE_ROUTERS = ['polls.routers.VoteShardRouter', 'polls.routers.ReplicaRouter']
+
+POLLS_SQLITE_PROFILE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),
+    'mmap_size': config("SQLITE_MMAP_SIZE", default=268435456, cast=int),
+    'cache_size': config("SQLITE_CACHE_SIZE", default=-20000, cast=int),
+}
+POLLS_SQLITE_PRAGMAS = POLLS_SQLITE_PROFILE_PRAGMAS if SQLITE_PROFILE else {}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# The default local memory cache is private to each process. With several worker processes
+# or nodes, share it through CACHE_BACKEND and CACHE_LOCATION, for example
+# django.core.cache.backends.memcached.PyMemcacheCache with host:port pairs separated by
+# semicolons, or django.core.cache.backends.filebased.FileBasedCache with a shared directory
+# on one node. Results, ballots, index pages, sessions, rate limits and replica pins all
+# live in this cache; the polls.W001 check warns when it is not shared but replicas are used.
+
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config("CACHE_LOCATION", default='ku-polls'),
+        'KEY_PREFIX': config("CACHE_KEY_PREFIX", default=''),
+    }
+}
+
+# Sessions are read from the cache and only fall back to the database on a miss, and flash
+# messages travel in a signed cookie, so a page view needs no django_session query. Set
+# SESSION_ENGINE to django.contrib.sessions.backends.signed_cookies to keep sessions out of
+# the database entirely. Both need a cache shared by the worker processes, or signed cookies.
+SESSION_ENGINE = config("SESSION_ENGINE", default='django.contrib.sessions.backends.cached_db')
+MESSAGE_STORAGE = config("MESSAGE_STORAGE", default='django.contrib.messages.storage.cookie.CookieStorage')
+
+# Longest time in seconds a rendered poll index is kept, even if no poll opens or closes.
+POLLS_INDEX_CACHE_TIMEOUT = config("POLLS_INDEX_CACHE_TIMEOUT", default=300, cast=int)
+
+# Number of polls per page of the index, and of its JSON listing.
+POLLS_INDEX_PAGE_SIZE = config("POLLS_INDEX_PAGE_SIZE", default=20, cast=int)
+
+# Longest time in seconds the results of an open poll are kept. Results of closed polls never expire.
+POLLS_RESULTS_CACHE_TIMEOUT = config("POLLS_RESULTS_CACHE_TIMEOUT", default=60, cast=int)
+
+# Longest time in seconds the polling period and choices of a question are kept in the shared
+# cache for the detail page and vote checks. Edits drop them at once.
+POLLS_BALLOT_CACHE_TIMEOUT = config("POLLS_BALLOT_CACHE_TIMEOUT", default=3600, cast=int)
+
+# The prewarm_polls command warms the caches of a question POLLS_PREWARM_LEAD seconds before
+# it opens, and checks for openings and closings at least every POLLS_PREWARM_INTERVAL seconds.
+# It runs in its own process, so it refuses to run unless CACHE_BACKEND is a shared cache.
+POLLS_PREWARM_LEAD = config("POLLS_PREWARM_LEAD", default=60, cast=int)
+POLLS_PREWARM_INTERVAL = config("POLLS_PREWARM_INTERVAL", default=5.0, cast=float)
+
+# Questions whose polling period and choice ids are kept in each process to check votes,
+# and seconds before an entry is read again. Edits in the same process apply at once.
+POLLS_ELIGIBILITY_CACHE_SIZE = config("POLLS_ELIGIBILITY_CACHE_SIZE", default=1024, cast=int)
+POLLS_ELIGIBILITY_CACHE_TTL = config("POLLS_ELIGIBILITY_CACHE_TTL", default=30, cast=int)
+
+# Token bucket rates per endpoint, per IP address and per logged in user, as requests/period
+# with period one of s, m, h or d. The buckets are kept in the POLLS_RATE_LIMIT_CACHE cache,
+# which has to be shared by the worker processes for the limits to hold across them.
+POLLS_RATE_LIMIT_CACHE = config("POLLS_RATE_LIMIT_CACHE", default='default')
+POLLS_RATE_LIMITS = {
+    'vote': {
+        'ip': config("POLLS_VOTE_RATE_PER_IP", default='120/m'),
+        'user': config("POLLS_VOTE_RATE_PER_USER", default='20/m'),
+    },
+}
+
+# Seconds between checks of the cached results for the live results streams, and between keep-alive comments.
+POLLS_STREAM_INTERVAL = config("POLLS_STREAM_INTERVAL", default=1.0, cast=float)
+POLLS_STREAM_HEARTBEAT = config("POLLS_STREAM_HEARTBEAT", default=15.0, cast=float)
+
+
+# Vote queue
+# When POLLS_VOTE_QUEUE is on, votes are appended to a side SQLite file and a background
+# thread writes them to the database in batches. `manage.py flush_votes` drains the queue.
+# The depth of the queue and the flush counts and latency are logged as one JSON line every
+# POLLS_VOTE_QUEUE_STATS_INTERVAL seconds and served to staff at polls/metrics/.
+
+POLLS_VOTE_QUEUE = config("POLLS_VOTE_QUEUE", default=False, cast=bool)
+POLLS_VOTE_QUEUE_PATH = config("POLLS_VOTE_QUEUE_PATH", default=str(BASE_DIR / 'vote-queue.sqlite3'))
+POLLS_VOTE_QUEUE_FLUSH_INTERVAL = config("POLLS_VOTE_QUEUE_FLUSH_INTERVAL", default=0.5, cast=float)
+POLLS_VOTE_QUEUE_BATCH_SIZE = config("POLLS_VOTE_QUEUE_BATCH_SIZE", default=500, cast=int)
+POLLS_VOTE_QUEUE_STATS_INTERVAL = config("POLLS_VOTE_QUEUE_STATS_INTERVAL", default=60, cast=int)
+
+
+# Request metrics
+# RequestMetricsMiddleware records time and queries per request. A request that runs the same SQL
+# POLLS_METRICS_N_PLUS_ONE_THRESHOLD times is logged as a likely N+1, and the aggregates are logged
+# every POLLS_METRICS_LOG_INTERVAL seconds and served to staff at polls/metrics/.
+
+POLLS_METRICS = config("POLLS_METRICS", default=True, cast=bool)
+POLLS_METRICS_N_PLUS_ONE_THRESHOLD = config("POLLS_METRICS_N_PLUS_ONE_THRESHOLD", default=5, cast=int)
+POLLS_METRICS_LOG_INTERVAL = config("POLLS_METRICS_LOG_INTERVAL", default=60, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -125,6 +267,10 @@ STATIC_URL = '/static/'
 
 LOGIN_REDIRECT_URL = 'polls:index'
 
+# Audit events of logins and votes are written as JSON lines to a rotating file by a
+# background thread. Up to POLLS_AUDIT_LOG_QUEUE_SIZE events wait for it; more are dropped
+# and counted, so the log never slows down a request. Tests and benchmarks write it to a
+# temporary directory instead of POLLS_AUDIT_LOG_PATH.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -132,9 +278,27 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'audit': {
+            'class': 'polls.audit.AuditQueueHandler',
+            'filename': config("POLLS_AUDIT_LOG_PATH", default=str(BASE_DIR / 'audit.log')),
+            'max_bytes': config("POLLS_AUDIT_LOG_MAX_BYTES", default=10485760, cast=int),
+            'backup_count': config("POLLS_AUDIT_LOG_BACKUP_COUNT", default=5, cast=int),
+            'queue_size': config("POLLS_AUDIT_LOG_QUEUE_SIZE", default=10000, cast=int),
+            'batch_size': config("POLLS_AUDIT_LOG_BATCH_SIZE", default=100, cast=int),
+        },
+    },
+    'loggers': {
+        'polls.audit': {
+            'handlers': ['audit'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
         'level': 'DEBUG',
     },
 }
+
+# The test runner sends the audit log to a temporary directory.
+TEST_RUNNER = 'polls.tests.runner.PollsTestRunner'
@@ -6,3 +6,13 @@ class PollsConfig(AppConfig):
     """A class for poll configuration."""
 
     name = 'polls'
+
+    def ready(self):
+        """Connect the cache, SQLite and audit signals, register the checks, and compile the templates."""
+        from django.conf import settings
+
+        from . import audit, checks, signals, sqlite  # noqa: F401
+        from .warmup import warm_templates
+
+        if settings.POLLS_TEMPLATE_CACHE:
+            warm_templates()
@@ -0,0 +1,192 @@
+"""Module for writing audit events of logins and votes off the request thread."""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from django.contrib.auth import user_logged_in, user_logged_out, user_login_failed
+from django.dispatch import receiver
+
+logger = logging.getLogger('polls.audit')
+
+
+def audit(event, request=None, **fields):
+    """
+    Record an audit event.
+
+    Arguments:
+        event: the name of the event, such as 'login' or 'vote'.
+        request: the request of the event, for its IP address.
+        fields: the details of the event, written as JSON.
+    """
+    if request is not None:
+        fields['ip'] = request.META.get('REMOTE_ADDR')
+    logger.info(event, extra={'audit': fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object with its time, level, event and audit fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'event': record.getMessage(),
+            **getattr(record, 'audit', {}),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """A rotating file handler that leaves flushing to the end of each batch."""
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingQueueListener(QueueListener):
+    """A queue listener that writes up to `batch_size` waiting records at a time and then flushes once."""
+
+    def __init__(self, log_queue, *handlers, batch_size=100):
+        super().__init__(log_queue, *handlers)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        stop = False
+        while not stop:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size and batch[-1] is not self._sentinel:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                self.queue.task_done()
+            for handler in self.handlers:
+                handler.flush()
+
+
+class AuditQueueHandler(QueueHandler):
+    """
+    A logging handler that puts records on a bounded queue for a background writer.
+
+    The request thread only copies the record onto the queue. A BatchingQueueListener
+    started on the first record formats the records as JSON lines and writes them to
+    a rotating file in batches. When the queue is full the record is dropped and
+    counted rather than making the request wait.
+    """
+
+    def __init__(self, filename, max_bytes=10485760, backup_count=5, queue_size=10000, batch_size=100):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        file_handler = BatchedRotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                  delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        self.file_handler = file_handler
+        self.listener = BatchingQueueListener(self.queue, file_handler, batch_size=batch_size)
+        self.started = False
+        self.start_lock = threading.Lock()
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Keep the audit fields and defer the formatting to the writer thread."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if not self.started:
+            with self.start_lock:
+                if not self.started:
+                    self.listener.start()
+                    atexit.register(self.stop)
+                    self.started = True
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Write the records still queued and stop the writer thread."""
+        with self.start_lock:
+            if self.started:
+                self.listener.stop()
+                self.started = False
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def set_filename(self, filename):
+        """Write the records to another file, after the records already queued are written to the current one."""
+        self.stop()
+        self.file_handler.close()
+        self.file_handler.baseFilename = os.path.abspath(filename)
+
+
+def use_audit_log(filename):
+    """
+    Write the audit log to another file than the one in the settings.
+
+    Tests and benchmarks send it to a temporary directory, so they never write the
+    production log.
+
+    Arguments:
+        filename: the path of the new log file.
+    """
+    for handler in logger.handlers:
+        if isinstance(handler, AuditQueueHandler):
+            handler.set_filename(filename)
+
+
+def audit_stats():
+    """
+    Get the counters of the audit log handlers.
+
+    Returns:
+        dict: the records waiting to be written and the records dropped because the queue was full.
+    """
+    handlers = [handler for handler in logger.handlers if isinstance(handler, AuditQueueHandler)]
+    return {'queued': sum(handler.queue.qsize() for handler in handlers),
+            'dropped': sum(handler.dropped for handler in handlers)}
+
+
+@receiver(user_logged_in)
+def log_login(sender, request, user, **kwargs):
+    audit('login', request, user=user.get_username())
+
+
+@receiver(user_logged_out)
+def log_logout(sender, request, user, **kwargs):
+    audit('logout', request, user=user.get_username() if user else None)
+
+
+@receiver(user_login_failed)
+def log_login_failed(sender, credentials, request=None, **kwargs):
+    audit('login_failed', request, user=credentials.get('username'))
@@ -0,0 +1,263 @@
+"""Module for caching rendered poll pages."""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Min, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.http import quote_etag
+from django.utils.safestring import mark_safe
+
+from .models import Question, Choice, VoteRollup
+from .routers import use_replicas
+from .shards import is_sharded
+
+INDEX_VERSION_KEY = 'polls:index:version'
+INDEX_FRAGMENT_KEY = 'polls:index:fragment:{version}:{cursor}'
+
+
+def get_index_version():
+    """
+    Get the current version of the index listing.
+
+    A missing version starts from the current time in milliseconds, so a version that
+    was evicted from the cache never comes back to a number used by an older fragment.
+
+    Returns:
+        int: the version to put into the fragment key.
+    """
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(INDEX_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(INDEX_VERSION_KEY)
+    return version
+
+
+def bump_index_version():
+    """Invalidate every cached index fragment by moving to the next version."""
+    try:
+        cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        get_index_version()
+
+
+def seconds_until_next_boundary(now):
+    """
+    Get how long the index listing stays the same.
+
+    Arguments:
+        now: the time the listing is rendered at.
+
+    Returns:
+        int: seconds until the next pub_date or end_date, capped at POLLS_INDEX_CACHE_TIMEOUT.
+    """
+    timeout = settings.POLLS_INDEX_CACHE_TIMEOUT
+    boundaries = Question.objects.aggregate(next_pub=Min('pub_date', filter=Q(pub_date__gt=now)),
+                                            next_end=Min('end_date', filter=Q(end_date__gt=now)))
+    for boundary in boundaries.values():
+        if boundary is not None:
+            timeout = min(timeout, (boundary - now).total_seconds())
+    return max(1, int(timeout))
+
+
+def get_index_fragment(question_list):
+    """
+    Get the rendered question list of an index page, rendering it on a cache miss.
+
+    Arguments:
+        question_list: KeysetPage of the questions to list, only evaluated on a cache miss.
+
+    Returns:
+        SafeString: the rendered list.
+    """
+    key = INDEX_FRAGMENT_KEY.format(version=get_index_version(), cursor=question_list.cursor)
+    fragment = cache.get(key)
+    if fragment is None:
+        now = timezone.now()
+        # The cache is shared, so it is filled from the primary, never from a replica that lags.
+        with use_replicas(False):
+            fragment = render_to_string('polls/question_list.html', {'question_list': question_list})
+            timeout = seconds_until_next_boundary(now)
+        cache.set(key, str(fragment), timeout)
+    return mark_safe(fragment)
+
+
+BALLOT_KEY = 'polls:ballot:{pk}'
+
+
+def build_ballot(pk, question=None):
+    """
+    Read the polling period and the choices of a question and put them into the cache.
+
+    Arguments:
+        pk: the id of the question.
+        question: the question, if the caller has loaded it from the primary already.
+
+    Returns:
+        dict: the pub_date, the end_date and the choices as (id, choice_text) pairs,
+        or None if the question does not exist.
+    """
+    with use_replicas(False):
+        if question is not None and question._state.db == DEFAULT_DB_ALIAS:
+            period = (question.pub_date, question.end_date)
+        else:
+            period = Question.objects.filter(pk=pk).values_list('pub_date', 'end_date').first()
+        if period is None:
+            return None
+        choices = list(Choice.objects.filter(question_id=pk).order_by('pk').values_list('id', 'choice_text'))
+    ballot = {'pub_date': period[0], 'end_date': period[1], 'choices': choices}
+    cache.set(BALLOT_KEY.format(pk=pk), ballot, settings.POLLS_BALLOT_CACHE_TIMEOUT)
+    return ballot
+
+
+def get_ballot(pk, question=None):
+    """
+    Get what a voter sees of a question, building it on a cache miss.
+
+    Arguments:
+        pk: the id of the question.
+        question: the question, if the caller has loaded it already.
+
+    Returns:
+        dict: the pub_date, the end_date and the choices as (id, choice_text) pairs,
+        or None if the question does not exist.
+    """
+    ballot = cache.get(BALLOT_KEY.format(pk=pk))
+    if ballot is None:
+        ballot = build_ballot(pk, question)
+    return ballot
+
+
+def invalidate_ballot(pk):
+    """Drop the cached ballot of a question."""
+    cache.delete(BALLOT_KEY.format(pk=pk))
+
+
+RESULTS_KEY = 'polls:results:{pk}'
+RESULTS_COUNT_KEY = 'polls:results:{pk}:count:{choice}'
+RESULTS_MODIFIED_KEY = 'polls:results:{pk}:modified'
+
+
+def results_count_keys(pk, choice_ids):
+    """Get the cache keys of the question total and of each choice tally, in that order."""
+    return [RESULTS_COUNT_KEY.format(pk=pk, choice=choice) for choice in ['total', *choice_ids]]
+
+
+def build_results_snapshot(pk):
+    """
+    Read the results of a question from the tallies and put them into the cache.
+
+    With sharded votes, the tallies are summed from the rollups on the shard of the question.
+
+    Results of a closed poll never change, so they are kept without a timeout. Results of
+    an open poll expire after POLLS_RESULTS_CACHE_TIMEOUT, or when the poll closes. Results
+    of a poll that is not open yet are kept until POLLS_RESULTS_CACHE_TIMEOUT after it opens,
+    so results warmed ahead of the opening are still there for the first voters.
+
+    Arguments:
+        pk: the id of the question.
+
+    Returns:
+        dict: the snapshot, or None if the question does not exist.
+    """
+    with use_replicas(False):
+        question = Question.objects.filter(pk=pk).first()
+        if question is None:
+            return None
+        choices = list(question.choice_set.values_list('id', 'choice_text', 'vote_count'))
+    total = question.vote_count
+    if is_sharded():
+        tallies = VoteRollup.objects.tallies(pk)
+        choices = [(choice_id, text, tallies.get(choice_id, 0)) for choice_id, text, _ in choices]
+        total = sum(count for _, _, count in choices)
+    now = timezone.now()
+    closed = question.end_date < now
+    timeout = None
+    if not closed:
+        opens_in = max(0, (question.pub_date - now).total_seconds())
+        timeout = min(opens_in + settings.POLLS_RESULTS_CACHE_TIMEOUT, (question.end_date - now).total_seconds())
+        timeout = max(1, int(timeout))
+    modified = time.time()
+    counts = [total, *(count for _, _, count in choices)]
+    meta = {'id': question.id, 'question_text': question.question_text, 'closed': closed,
+            'choices': [(choice_id, text) for choice_id, text, _ in choices]}
+    keys = results_count_keys(pk, [choice_id for choice_id, _, _ in choices])
+    cache.set_many({**dict(zip(keys, counts)), RESULTS_MODIFIED_KEY.format(pk=pk): modified}, timeout)
+    # The question is stored last, so a reader that finds it also finds the counters.
+    cache.set(RESULTS_KEY.format(pk=pk), meta, timeout)
+    return make_snapshot(meta, counts, modified)
+
+
+def make_snapshot(meta, counts, modified):
+    """Combine the cached question, its counters and its modification time into a snapshot."""
+    return {
+        'question': {'id': meta['id'], 'question_text': meta['question_text'], 'vote_count': counts[0]},
+        'choices': [{'id': choice_id, 'choice_text': text, 'vote_count': count}
+                    for (choice_id, text), count in zip(meta['choices'], counts[1:])],
+        'closed': meta['closed'],
+        'modified': modified,
+    }
+
+
+def snapshot_etag(snapshot):
+    """
+    Get an entity tag that changes whenever a tally of the snapshot changes.
+
+    Returns:
+        str: the quoted entity tag.
+    """
+    counts = [snapshot['question']['vote_count'], *(choice['vote_count'] for choice in snapshot['choices'])]
+    return quote_etag(f"{snapshot['question']['id']}-{hashlib.md5(repr(counts).encode()).hexdigest()}")
+
+
+def get_results_snapshot(pk):
+    """
+    Get the results of a question, building the snapshot on a cache miss.
+
+    Arguments:
+        pk: the id of the question.
+
+    Returns:
+        dict: the question, its choices with their tallies, whether the poll is closed,
+        and the time of the last change. None if the question does not exist.
+    """
+    meta = cache.get(RESULTS_KEY.format(pk=pk))
+    if meta is None:
+        return build_results_snapshot(pk)
+    keys = results_count_keys(pk, [choice_id for choice_id, _ in meta['choices']])
+    modified_key = RESULTS_MODIFIED_KEY.format(pk=pk)
+    values = cache.get_many([*keys, modified_key])
+    if len(values) != len(keys) + 1:
+        return build_results_snapshot(pk)
+    return make_snapshot(meta, [values[key] for key in keys], values[modified_key])
+
+
+def update_results_snapshot(question_id, previous_choice_id, choice_id):
+    """
+    Apply a vote to the cached results of an open poll instead of rebuilding them.
+
+    Arguments:
+        question_id: the id of the question that is voted on.
+        previous_choice_id: the choice the user voted for before, or None for a first vote.
+        choice_id: the newly selected choice.
+    """
+    if previous_choice_id == choice_id or cache.get(RESULTS_KEY.format(pk=question_id)) is None:
+        return
+    try:
+        if previous_choice_id is None:
+            cache.incr(RESULTS_COUNT_KEY.format(pk=question_id, choice='total'))
+        else:
+            cache.decr(RESULTS_COUNT_KEY.format(pk=question_id, choice=previous_choice_id))
+        cache.incr(RESULTS_COUNT_KEY.format(pk=question_id, choice=choice_id))
+        cache.set(RESULTS_MODIFIED_KEY.format(pk=question_id), time.time(), settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    except ValueError:
+        # A counter was evicted, so the next read rebuilds the whole snapshot.
+        invalidate_results_snapshot(question_id)
+
+
+def invalidate_results_snapshot(pk):
+    """Drop the cached results of a question."""
+    cache.delete(RESULTS_KEY.format(pk=pk))
@@ -0,0 +1,23 @@
+"""Module for checking the deployment settings of the polls app."""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def is_process_local_cache():
+    """Check if the default cache is private to each process, so other processes never see what one stores."""
+    return settings.CACHES['default']['BACKEND'] in LOCAL_CACHES
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when replicas are used with a cache that the worker processes do not share."""
+    if settings.POLLS_REPLICAS and is_process_local_cache():
+        return [Warning(
+            "Read replicas are used with a cache private to each process.",
+            hint="Set CACHE_BACKEND to a shared cache, such as memcached, so a user reads their own votes "
+                 "from the primary in every worker process.",
+            id='polls.W001',
+        )]
+    return []
@@ -0,0 +1,116 @@
+"""Module for caching, in process, what a vote needs to be checked against."""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import get_ballot
+
+
+class Eligibility(namedtuple('Eligibility', ['pub_date', 'end_date', 'choice_ids'])):
+    """The polling period of a question and the ids of its choices."""
+
+    def can_vote(self, now=None):
+        """Check if the question can be voted now, as in Question.can_vote."""
+        now = now or timezone.now()
+        return self.pub_date <= now <= self.end_date
+
+
+MISSING = object()
+
+
+class EligibilityCache:
+    """
+    A bounded, least recently used cache of the Eligibility of questions, with a time to live.
+
+    The cache lives in the process, so a vote is checked without any query once its
+    question is cached. A miss reads the ballot of the question from the shared cache,
+    so only the first process to need a question queries the database. Signals drop the
+    entry of a question when it or one of its choices is saved or deleted in this process.
+    Changes made by other processes, or by bulk operations that send no signals, show
+    after at most POLLS_ELIGIBILITY_CACHE_TTL seconds.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        """
+        Arguments:
+            max_size: the most questions kept, POLLS_ELIGIBILITY_CACHE_SIZE by default.
+            ttl: seconds an entry is kept, POLLS_ELIGIBILITY_CACHE_TTL by default.
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return self._max_size if self._max_size is not None else settings.POLLS_ELIGIBILITY_CACHE_SIZE
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else settings.POLLS_ELIGIBILITY_CACHE_TTL
+
+    def get(self, question_id):
+        """
+        Get the Eligibility of a question, loading it on a miss.
+
+        Returns:
+            Eligibility: the polling period and choice ids, or None if the question does not exist.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(question_id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(question_id)
+                self.hits += 1
+                return None if entry[1] is MISSING else entry[1]
+            self.misses += 1
+            generation = self.generation
+        eligibility = self.load(question_id)
+        with self.lock:
+            # An invalidation while loading means the loaded value may be stale already.
+            if generation == self.generation:
+                self.entries[question_id] = (now + self.ttl, MISSING if eligibility is None else eligibility)
+                self.entries.move_to_end(question_id)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return eligibility
+
+    def load(self, question_id):
+        """Read the Eligibility of a question from the ballot in the shared cache, or else the database."""
+        ballot = get_ballot(question_id)
+        if ballot is None:
+            return None
+        return Eligibility(ballot['pub_date'], ballot['end_date'],
+                           frozenset(choice_id for choice_id, _ in ballot['choices']))
+
+    def invalidate(self, question_id):
+        """Drop the entry of a question."""
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(question_id, None)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        Get the counters of the cache.
+
+        Returns:
+            dict: the hits, misses and number of questions cached.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+eligibility_cache = EligibilityCache()
@@ -0,0 +1,243 @@
+"""Module for queueing votes and writing them to the database in batches."""
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache import invalidate_results_snapshot
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+
+class VoteQueue:
+    """
+    A durable queue of votes kept in a side SQLite file in WAL mode.
+
+    Putting a vote only appends a row to the side file, so it never waits for the
+    write lock of the main database. Flushers claim the oldest rows, apply them and
+    delete them. Only one claim is live at a time, so batches are applied in order
+    even when several processes flush the same file.
+    """
+
+    def __init__(self, path, claim_timeout=60):
+        self.path = str(path)
+        self.claim_timeout = claim_timeout
+        self.local = threading.local()
+
+    def connect(self):
+        """Get the connection of the current thread, creating the queue table on first use."""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS queued_vote ("
+                               "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                               "question_id INTEGER NOT NULL, choice_id INTEGER NOT NULL, "
+                               "queued_at REAL NOT NULL, claimed_by TEXT, claimed_at REAL)")
+            self.local.connection = connection
+        return connection
+
+    def put(self, user_id, question_id, choice_id):
+        """Append a vote to the queue."""
+        self.connect().execute("INSERT INTO queued_vote (user_id, question_id, choice_id, queued_at) "
+                               "VALUES (?, ?, ?, ?)", (user_id, question_id, choice_id, time.time()))
+
+    def depth(self):
+        """Get the number of votes that are not applied yet."""
+        return self.connect().execute("SELECT COUNT(*) FROM queued_vote").fetchone()[0]
+
+    def claim(self, batch_size):
+        """
+        Claim the oldest votes for a flush.
+
+        Claims older than claim_timeout belong to a flusher that died, so they are taken over.
+
+        Arguments:
+            batch_size: the largest number of votes to claim.
+
+        Returns:
+            tuple: the claim token and the list of (user_id, question_id, choice_id) in queue order.
+            The list is empty if the queue is empty or another flusher holds a live claim.
+        """
+        connection = self.connect()
+        token = uuid.uuid4().hex
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            live = connection.execute("SELECT 1 FROM queued_vote WHERE claimed_by IS NOT NULL AND claimed_at > ? "
+                                      "LIMIT 1", (now - self.claim_timeout,)).fetchone()
+            if live is None:
+                connection.execute("UPDATE queued_vote SET claimed_by = ?, claimed_at = ? WHERE id IN "
+                                   "(SELECT id FROM queued_vote ORDER BY id LIMIT ?)", (token, now, batch_size))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        rows = connection.execute("SELECT user_id, question_id, choice_id FROM queued_vote WHERE claimed_by = ? "
+                                  "ORDER BY id", (token,)).fetchall()
+        return token, rows
+
+    def release(self, token):
+        """Give claimed votes back to the queue after a failed flush."""
+        self.connect().execute("UPDATE queued_vote SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?",
+                               (token,))
+
+    def remove(self, token):
+        """Delete claimed votes after they were applied."""
+        self.connect().execute("DELETE FROM queued_vote WHERE claimed_by = ?", (token,))
+
+
+class VoteFlusher(threading.Thread):
+    """
+    A background thread that applies queued votes to the Vote table in batches.
+
+    Its stats are logged as one JSON line every `stats_interval` seconds while it runs.
+    """
+
+    def __init__(self, queue, interval, batch_size, stats_interval=60):
+        super().__init__(name='polls-vote-flusher', daemon=True)
+        self.queue = queue
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stats_interval = stats_interval
+        self.last_logged = time.monotonic()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.flushed = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Flushing the vote queue failed")
+            finally:
+                close_old_connections()
+            self.log_if_due()
+
+    def flush(self):
+        """
+        Apply one batch of queued votes, where the last vote of a user on a question wins.
+
+        Returns:
+            int: the number of queued votes that were applied.
+        """
+        with self.lock:
+            token, rows = self.queue.claim(self.batch_size)
+            if not rows:
+                return 0
+            start = time.perf_counter()
+            votes = {(user_id, question_id): choice_id for user_id, question_id, choice_id in rows}
+            try:
+                questions = Vote.objects.cast_many(votes)
+            except Exception:
+                self.queue.release(token)
+                raise
+            self.queue.remove(token)
+            for question_id in questions:
+                invalidate_results_snapshot(question_id)
+            elapsed = time.perf_counter() - start
+            self.flushed += len(rows)
+            self.batches += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+            logger.debug("Flushed %d queued votes in %.3f s", len(rows), elapsed)
+            return len(rows)
+
+    def drain(self):
+        """Flush batches until the queue has no more votes to apply."""
+        while self.flush() == self.batch_size:
+            pass
+
+    def stop(self):
+        """Stop the thread and apply every vote still in the queue."""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.drain()
+
+    def stats(self):
+        """
+        Get the metrics of the queue and of this flusher.
+
+        Returns:
+            dict: queue depth, flushed votes and batches, and flush latency in seconds.
+        """
+        return {
+            'queue_depth': self.queue.depth(),
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'mean_flush_seconds': self.total_flush_seconds / self.batches if self.batches else 0.0,
+        }
+
+    def log_if_due(self):
+        """Write the stats as one JSON log line at most every `stats_interval` seconds."""
+        now = time.monotonic()
+        if now - self.last_logged < self.stats_interval:
+            return
+        self.last_logged = now
+        try:
+            stats = self.stats()
+        except sqlite3.Error:
+            logger.exception("Reading the vote queue stats failed")
+            return
+        logger.info(json.dumps({'event': 'vote_queue_stats', **stats}))
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def make_vote_flusher():
+    """Create a flusher for the queue configured in the settings, without starting it."""
+    return VoteFlusher(VoteQueue(settings.POLLS_VOTE_QUEUE_PATH), settings.POLLS_VOTE_QUEUE_FLUSH_INTERVAL,
+                       settings.POLLS_VOTE_QUEUE_BATCH_SIZE, settings.POLLS_VOTE_QUEUE_STATS_INTERVAL)
+
+
+def get_vote_flusher():
+    """
+    Get the flusher of this process, starting it on first use.
+
+    The queue is drained when the process exits.
+
+    Returns:
+        VoteFlusher: the running flusher.
+    """
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = make_vote_flusher()
+            _flusher.start()
+            atexit.register(_flusher.stop)
+        return _flusher
+
+
+def vote_flusher_stats():
+    """
+    Get the stats of the flusher of this process.
+
+    Returns:
+        dict or None: the stats of VoteFlusher.stats, or None if no flusher was started.
+    """
+    flusher = _flusher
+    return flusher.stats() if flusher is not None else None
+
+
+def enqueue_vote(user_id, question_id, choice_id):
+    """Put a validated vote into the queue, to be written by the flusher."""
+    get_vote_flusher().queue.put(user_id, question_id, choice_id)
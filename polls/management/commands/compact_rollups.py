@@ -0,0 +1,34 @@
+"""Management command for merging old per-minute rollup rows."""
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from polls.models import VoteRollup
+from polls.shards import vote_databases
+
+
+class Command(BaseCommand):
+    """Merge the per-minute rollup rows older than some days into one row per hour."""
+
+    help = "Merge vote rollup rows older than --older-than days into hourly rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=7, help="Age in days of the rows to merge.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['older_than'])
+        for using in vote_databases():
+            old = VoteRollup.objects.using(using).filter(minute__lt=cutoff)
+            with transaction.atomic(using=using):
+                merged = list(old.annotate(hour=Trunc('minute', 'hour')).values('question_id', 'choice_id', 'hour')
+                              .annotate(total=Sum('count')).order_by())
+                removed, _ = old.delete()
+                VoteRollup.objects.using(using).bulk_create(
+                    (VoteRollup(question_id=row['question_id'], choice_id=row['choice_id'], minute=row['hour'],
+                                count=row['total']) for row in merged), batch_size=1000)
+            self.stdout.write(self.style.SUCCESS(f"Merged {removed} rollup rows into {len(merged)} hourly rows "
+                                                 f"on {using}."))
@@ -0,0 +1,146 @@
+"""Management command for exporting questions, choices and votes in bulk."""
+import csv
+import itertools
+import json
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+
+from polls.models import Question, Choice, Vote, VoteRollup
+from polls.shards import is_sharded, shard_for
+from .import_polls import parse_date
+
+QUESTION_COLUMNS = ['id', 'question_text', 'pub_date', 'end_date', 'choice_id', 'choice_text']
+VOTE_COLUMNS = ['question_id', 'choice_id', 'user_id']
+
+
+def question_chunks(questions, chunk_size):
+    """
+    Read questions in chunks ordered by id, with the choices of each chunk in one more query.
+
+    With sharded votes the vote count of each question is summed from the rollups on its shard.
+
+    Yields:
+        tuple: a question and the list of its choices.
+    """
+    last_pk = 0
+    while True:
+        chunk = list(questions.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        if is_sharded():
+            totals = VoteRollup.objects.totals([question.pk for question in chunk])
+            for question in chunk:
+                question.vote_count = totals.get(question.pk, 0)
+        choices = {}
+        for choice in Choice.objects.filter(question__in=chunk).order_by('pk'):
+            choices.setdefault(choice.question_id, []).append(choice)
+        for question in chunk:
+            yield question, choices.get(question.pk, [])
+
+
+def vote_rows(questions, chunk_size):
+    """
+    Read the votes of the questions, asking each vote shard only for the questions it holds.
+
+    Yields:
+        tuple: the VOTE_COLUMNS of a vote.
+    """
+    if not is_sharded():
+        yield from (Vote.objects.filter(question__in=questions.values('pk')).order_by()
+                    .values_list(*VOTE_COLUMNS).iterator(chunk_size=chunk_size))
+        return
+    ids = questions.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+    for chunk in iter(lambda: list(itertools.islice(ids, chunk_size)), []):
+        shards = defaultdict(list)
+        for pk in chunk:
+            shards[shard_for(pk)].append(pk)
+        for using, pks in shards.items():
+            yield from (Vote.objects.using(using).filter(question_id__in=pks).order_by()
+                        .values_list(*VOTE_COLUMNS).iterator(chunk_size=chunk_size))
+
+
+class Command(BaseCommand):
+    """Stream questions and choices, and optionally votes, of a date range to JSONL or CSV."""
+
+    help = "Export questions and choices published in a date range to JSONL or CSV, '-' for standard output."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help="Format of the file. Guessed from the file extension if not given.")
+        parser.add_argument('--since', help="Only questions published at or after this ISO 8601 date.")
+        parser.add_argument('--until', help="Only questions published before this ISO 8601 date.")
+        parser.add_argument('--votes', metavar='PATH', help="Also write the votes of the questions to this file.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows read from the database at a time.")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        questions = Question.objects.all()
+        if options['since']:
+            questions = questions.filter(pub_date__gte=parse_date(options['since']))
+        if options['until']:
+            questions = questions.filter(pub_date__lt=parse_date(options['until']))
+        with ExitStack() as stack:
+            output = self.open(stack, options['path'])
+            count = self.write_questions(output, file_format, question_chunks(questions, options['chunk_size']))
+            votes = 0
+            if options['votes']:
+                rows = vote_rows(questions, options['chunk_size'])
+                votes = self.write_votes(self.open(stack, options['votes']), file_format, rows)
+        self.stderr.write(f"Exported {count} questions and {votes} votes.")
+
+    def open(self, stack, path):
+        if path == '-':
+            return self.stdout
+        return stack.enter_context(open(path, 'w', newline='', encoding='utf-8'))
+
+    def write_questions(self, output, file_format, polls):
+        """
+        Write each question with its choices, in the format import_polls reads.
+
+        Both formats carry the question and choice ids, which the question_id and choice_id
+        of the votes refer to.
+
+        Returns:
+            int: the number of questions written.
+        """
+        writer = csv.writer(output) if file_format == 'csv' else None
+        if writer:
+            writer.writerow(QUESTION_COLUMNS)
+        count = 0
+        for question, choices in polls:
+            count += 1
+            dates = [question.pub_date.isoformat(), question.end_date.isoformat()]
+            if writer:
+                for choice in choices or [None]:
+                    writer.writerow([question.pk, question.question_text, *dates,
+                                     *([choice.pk, choice.choice_text] if choice else ['', ''])])
+            else:
+                output.write(json.dumps({
+                    'id': question.pk, 'question_text': question.question_text, 'pub_date': dates[0],
+                    'end_date': dates[1], 'vote_count': question.vote_count,
+                    'choices': [{'id': choice.pk, 'choice_text': choice.choice_text} for choice in choices],
+                }) + '\n')
+        return count
+
+    def write_votes(self, output, file_format, rows):
+        """
+        Write one line per vote.
+
+        Returns:
+            int: the number of votes written.
+        """
+        writer = csv.writer(output) if file_format == 'csv' else None
+        if writer:
+            writer.writerow(VOTE_COLUMNS)
+        count = 0
+        for row in rows:
+            count += 1
+            if writer:
+                writer.writerow(row)
+            else:
+                output.write(json.dumps(dict(zip(VOTE_COLUMNS, row))) + '\n')
+        return count
@@ -0,0 +1,29 @@
+"""Management command for writing queued votes to the database."""
+import json
+
+from django.core.management.base import BaseCommand
+
+from polls.ingest import make_vote_flusher
+
+
+class Command(BaseCommand):
+    """Apply the votes in the vote queue, once or in a loop."""
+
+    help = "Write the votes waiting in the vote queue to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep flushing every POLLS_VOTE_QUEUE_FLUSH_INTERVAL seconds until interrupted.")
+
+    def handle(self, *args, **options):
+        flusher = make_vote_flusher()
+        if options['loop']:
+            flusher.start()
+            try:
+                while flusher.is_alive():
+                    flusher.join(timeout=60)
+                    self.stdout.write(json.dumps(flusher.stats()))
+            except KeyboardInterrupt:
+                pass
+        flusher.stop()
+        self.stdout.write(json.dumps(flusher.stats()))
@@ -0,0 +1,132 @@
+"""Management command for importing questions and choices in bulk."""
+import csv
+import datetime
+import json
+import sys
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date as parse_day
+
+from polls.cache import bump_index_version
+from polls.models import Question, Choice
+
+
+def parse_date(value):
+    """Parse an ISO 8601 date or date and time, taking naive values to be in the current time zone."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None and parse_day(value) is not None:
+            parsed = datetime.datetime.combine(parse_day(value), datetime.time())
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"Invalid date: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def read_jsonl(lines):
+    """
+    Read polls from JSON lines.
+
+    Each line is {"question_text": ..., "pub_date": ..., "end_date": ..., "choices": [...]}, where
+    a choice is its text or, as written by export_polls, {"id": ..., "choice_text": ...}.
+
+    Yields:
+        tuple: the question text, the publish date, the end date and the list of choice texts.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            yield (record['question_text'], parse_date(record['pub_date']), parse_date(record['end_date']),
+                   [choice['choice_text'] if isinstance(choice, dict) else choice
+                    for choice in record.get('choices', [])])
+        except (ValueError, KeyError) as error:
+            raise CommandError(f"Line {number}: {error}")
+
+
+def read_csv(lines):
+    """
+    Read polls from CSV with the columns question_text, pub_date, end_date and choice_text.
+
+    Consecutive rows with the same question, publish date and end date are one question,
+    and each row adds one choice to it. An id column, as written by export_polls, also
+    tells questions apart. The imported questions and choices get new ids, so the id and
+    choice_id columns are not kept.
+
+    Yields:
+        tuple: the question text, the publish date, the end date and the list of choice texts.
+    """
+    rows = csv.DictReader(lines)
+    key = itemgetter('question_text', 'pub_date', 'end_date')
+    for (text, pub_date, end_date, _), group in groupby(rows, lambda row: (*key(row), row.get('id'))):
+        yield (text, parse_date(pub_date), parse_date(end_date),
+               [row['choice_text'] for row in group if row.get('choice_text')])
+
+
+def batches(polls, size):
+    """Split the polls into lists of at most `size` polls."""
+    batch = []
+    for poll in polls:
+        batch.append(poll)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    """Import questions with their choices from JSONL or CSV with bulk inserts."""
+
+    help = "Import questions and choices from a JSONL or CSV file, '-' for standard input."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help="Format of the file. Guessed from the file extension if not given.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Questions inserted per batch.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        reader = read_csv if file_format == 'csv' else read_jsonl
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        questions = choices = 0
+        try:
+            for batch in batches(reader(source), options['batch_size']):
+                questions += len(batch)
+                choices += self.insert(batch)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        bump_index_version()
+        self.stdout.write(self.style.SUCCESS(f"Imported {questions} questions and {choices} choices."))
+
+    def insert(self, batch):
+        """
+        Insert one batch of questions and their choices.
+
+        Returns:
+            int: the number of choices inserted.
+        """
+        with transaction.atomic():
+            created = Question.objects.bulk_create(
+                Question(question_text=text, pub_date=pub_date, end_date=end_date)
+                for text, pub_date, end_date, _ in batch)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # The ids are not returned, but inside the transaction the new rows hold the highest ids.
+                ids = sorted(Question.objects.order_by('-pk').values_list('pk', flat=True)[:len(created)])
+                for question, pk in zip(created, ids):
+                    question.pk = pk
+            new_choices = [Choice(question=question, choice_text=text)
+                           for question, (_, _, _, texts) in zip(created, batch) for text in texts]
+            Choice.objects.bulk_create(new_choices, batch_size=1000)
+        return len(new_choices)
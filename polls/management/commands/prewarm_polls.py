@@ -0,0 +1,38 @@
+"""Management command for warming the caches around poll openings and closings."""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.checks import is_process_local_cache
+from polls.warmup import PollScheduler
+
+
+class Command(BaseCommand):
+    """Warm the caches of polls about to open and freeze the results of closed polls, once or in a loop."""
+
+    help = "Warm the caches of polls about to open and store the final results of polls that closed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, waking at every opening and closing, until interrupted.")
+        parser.add_argument('--lead', type=int, help="Seconds before opening to warm a poll. POLLS_PREWARM_LEAD "
+                                                     "by default.")
+        parser.add_argument('--interval', type=float, help="Longest seconds between checks. "
+                                                           "POLLS_PREWARM_INTERVAL by default.")
+
+    def handle(self, *args, **options):
+        if is_process_local_cache():
+            raise CommandError("The default cache is private to each process, so the web workers would never "
+                               "read what this command warms. Set CACHE_BACKEND to a shared cache first.")
+        scheduler = PollScheduler(lead=options['lead'], interval=options['interval'])
+        try:
+            while True:
+                done = scheduler.tick()
+                if any(done.values()) or not options['loop']:
+                    self.stdout.write(json.dumps(done))
+                if not options['loop']:
+                    break
+                time.sleep(scheduler.seconds_until_next_tick())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,112 @@
+"""Management command for moving votes to the shards that own their questions."""
+import itertools
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from polls.cache import invalidate_results_snapshot
+from polls.models import Vote, VoteRollup
+from polls.shards import shard_for
+
+
+def misplaced_questions(using):
+    """
+    Find the questions with votes or rollup rows on a database that does not own them.
+
+    Returns:
+        list: (question id, alias of its shard) pairs, ordered by question id.
+    """
+    question_ids = set(Vote.objects.using(using).order_by().values_list('question_id', flat=True).distinct())
+    question_ids |= set(VoteRollup.objects.using(using).order_by().values_list('question_id', flat=True).distinct())
+    return sorted((question_id, shard_for(question_id)) for question_id in question_ids
+                  if question_id is not None and shard_for(question_id) != using)
+
+
+def move_question(question_id, source, target, batch_size=500):
+    """
+    Move the votes and rollup rows of a question from one database to another.
+
+    Votes keep their timestamps. A user who already has a vote for the question on the
+    target, cast there after the shards changed, keeps that vote; the moved one is
+    dropped and taken out of the rollup, so the rollup still sums to the votes. Both
+    databases are written in one transaction each, the target committed first, so a
+    failure leaves the rows on the source to move again.
+
+    Returns:
+        tuple: the number of votes moved and of votes dropped.
+    """
+    moved = dropped = 0
+    dropped_choices = Counter()
+    connection = connections[target]
+    table = connection.ops.quote_name(Vote._meta.db_table)
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        votes = (Vote.objects.using(source).filter(question_id=question_id).order_by('pk')
+                 .values_list('user_id', 'choice_id', 'created', 'updated').iterator(chunk_size=batch_size))
+        for batch in iter(lambda: list(itertools.islice(votes, batch_size)), []):
+            taken = set(Vote.objects.using(target).filter(question_id=question_id,
+                                                          user_id__in=[row[0] for row in batch])
+                        .values_list('user_id', flat=True))
+            rows = []
+            for user_id, choice_id, created, updated in batch:
+                if user_id in taken:
+                    dropped_choices[choice_id] += 1
+                else:
+                    rows.append((user_id, question_id, choice_id, adapt(created), adapt(updated)))
+            if rows:
+                with connection.cursor() as cursor:
+                    cursor.executemany(f"INSERT INTO {table} (user_id, question_id, choice_id, created, updated) "
+                                       f"VALUES (%s, %s, %s, %s, %s)", rows)
+            moved += len(rows)
+            dropped += len(batch) - len(rows)
+        minutes = defaultdict(dict)
+        for choice_id, minute, count in (VoteRollup.objects.using(source).filter(question_id=question_id)
+                                         .values_list('choice_id', 'minute', 'count')):
+            minutes[minute][question_id, choice_id] = count
+        for minute, deltas in minutes.items():
+            VoteRollup.objects.add(deltas, minute, target)
+        VoteRollup.objects.add({(question_id, choice_id): -count for choice_id, count in dropped_choices.items()},
+                               timezone.now(), target)
+        Vote.objects.using(source).filter(question_id=question_id).delete()
+        VoteRollup.objects.using(source).filter(question_id=question_id).delete()
+    return moved, dropped
+
+
+class Command(BaseCommand):
+    """Move the votes of every question to the shard that owns it under the current POLLS_VOTE_SHARDS."""
+
+    help = ("Move votes and rollups to the shards of their questions after DATABASE_VOTE_SHARDS changed, "
+            "including votes cast on the primary before sharding. Run rebuild_tallies after moving votes back "
+            "to the primary.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', default=[], metavar='ALIAS',
+                            help="Another database to drain, such as a shard being removed. May be repeated.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report the questions that would move.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Votes copied at a time.")
+
+    def handle(self, *args, **options):
+        sources = list(dict.fromkeys([DEFAULT_DB_ALIAS, *settings.POLLS_VOTE_SHARDS, *options['source']]))
+        for alias in sources:
+            if alias not in connections:
+                raise CommandError(f"Unknown database: {alias}")
+        questions = votes = dropped = 0
+        for source in sources:
+            for question_id, target in misplaced_questions(source):
+                questions += 1
+                if options['dry_run']:
+                    self.stdout.write(f"Question {question_id}: {source} -> {target}")
+                    continue
+                moved, lost = move_question(question_id, source, target, options['batch_size'])
+                invalidate_results_snapshot(question_id)
+                votes += moved
+                dropped += lost
+                self.stdout.write(f"Question {question_id}: moved {moved} votes from {source} to {target}.")
+        if options['dry_run']:
+            self.stdout.write(f"{questions} questions would move.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {votes} votes of {questions} questions; dropped {dropped} votes superseded on their shard."))
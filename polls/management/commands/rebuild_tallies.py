@@ -0,0 +1,59 @@
+"""Management command for rebuilding the vote tallies from the votes."""
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from polls.models import Question, Choice, Vote
+from polls.shards import vote_databases
+
+
+def find_mismatches(model, field):
+    """
+    Compare the stored tallies of a model with the number of votes, counted on every vote shard.
+
+    Arguments:
+        model: Question or Choice.
+        field: the name of the foreign key from Vote to the model.
+
+    Returns:
+        list: (pk, stored tally, counted votes) for every row whose tally is wrong.
+    """
+    counted = Counter()
+    for using in vote_databases():
+        counted.update(dict(Vote.objects.using(using).filter(**{f'{field}__isnull': False}).order_by()
+                            .values_list(field).annotate(total=Count('pk'))))
+    return [(pk, stored, counted.get(pk, 0))
+            for pk, stored in model.objects.values_list('pk', 'vote_count').iterator()
+            if stored != counted.get(pk, 0)]
+
+
+class Command(BaseCommand):
+    """Recount the choice and question tallies from the Vote rows and check that they match."""
+
+    help = "Rebuild the vote tallies of choices and questions from the Vote rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report tallies that do not match the votes, without fixing them.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = {model: find_mismatches(model, field)
+                          for model, field in ((Question, 'question'), (Choice, 'choice'))}
+            for model, rows in mismatches.items():
+                for pk, stored, counted in rows:
+                    self.stdout.write(f"{model.__name__} {pk}: tally {stored}, votes {counted}")
+            total = sum(len(rows) for rows in mismatches.values())
+            if options['check']:
+                if total:
+                    raise CommandError(f"{total} tallies do not match the votes.")
+                self.stdout.write(self.style.SUCCESS("All tallies match the votes."))
+                return
+            for model, rows in mismatches.items():
+                for pk, stored, counted in rows:
+                    model.objects.filter(pk=pk).update(vote_count=counted)
+            if any(find_mismatches(model, field) for model, field in ((Question, 'question'), (Choice, 'choice'))):
+                raise CommandError("Tallies still do not match the votes after the rebuild.")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} tallies; all tallies match the votes."))
@@ -0,0 +1,44 @@
+"""Management command for copying the primary SQLite database to its read replicas."""
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """Copy the primary database over each replica of POLLS_REPLICAS, once or in a loop."""
+
+    help = "Copy the primary SQLite database to the read replicas, standing in for replication when run locally."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help="Keep copying every SECONDS seconds until interrupted, so the replicas lag by "
+                                 "about that much.")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replicas only copies SQLite databases; use the replication of the database.")
+        if not settings.POLLS_REPLICAS:
+            raise CommandError("No replicas are configured; set DATABASE_REPLICAS.")
+        try:
+            while True:
+                self.sync(primary)
+                if not options['loop']:
+                    break
+                time.sleep(options['loop'])
+        except KeyboardInterrupt:
+            pass
+
+    def sync(self, primary):
+        """Copy the primary over every replica with the SQLite online backup, which readers may share."""
+        primary.ensure_connection()
+        for alias in settings.POLLS_REPLICAS:
+            replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write(f"Copied {primary.settings_dict['NAME']} to {alias}.")
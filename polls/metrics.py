@@ -0,0 +1,181 @@
+"""Module for measuring the time and queries spent on each request."""
+import contextvars
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+WALL_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """What one request spent on the database and on templates."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Time a query, used as a database execute wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_statements(self, threshold):
+        """Get the statements that ran at least `threshold` times, usually with different parameters."""
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets, plus their sum."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [f'le_{bound}' for bound in self.bounds] + ['inf']
+        return {'buckets': dict(zip(labels, self.counts)), 'sum': round(self.total, 3)}
+
+
+class MetricsRegistry:
+    """Process-wide aggregates of the request metrics, by view name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.last_logged = time.monotonic()
+
+    def record(self, view_name, wall_ms, metrics, repeated):
+        with self.lock:
+            view = self.views.get(view_name)
+            if view is None:
+                view = self.views[view_name] = {
+                    'requests': 0, 'n_plus_one': 0, 'db_ms': 0.0, 'template_ms': 0.0,
+                    'wall_ms': Histogram(WALL_BUCKETS_MS), 'queries': Histogram(QUERY_BUCKETS),
+                }
+            view['requests'] += 1
+            view['n_plus_one'] += bool(repeated)
+            view['db_ms'] += metrics.db_seconds * 1000
+            view['template_ms'] += metrics.template_seconds * 1000
+            view['wall_ms'].observe(wall_ms)
+            view['queries'].observe(metrics.queries)
+
+    def snapshot(self):
+        """
+        Get the aggregates of every view.
+
+        Returns:
+            dict: per view name, the request count, the wall time and query histograms,
+            the total database and template time in milliseconds and the N+1 count.
+        """
+        with self.lock:
+            return {name: {key: value.as_dict() if isinstance(value, Histogram) else
+                           round(value, 3) if isinstance(value, float) else value
+                           for key, value in view.items()}
+                    for name, view in self.views.items()}
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def log_if_due(self, interval):
+        """Write the aggregates as one JSON log line at most every `interval` seconds."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_logged < interval:
+                return
+            self.last_logged = now
+        logger.info(json.dumps({'event': 'request_metrics', 'views': self.snapshot()}))
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the wall time, queries, database time, template time and view of each request.
+
+    Requests that run the same SQL POLLS_METRICS_N_PLUS_ONE_THRESHOLD times or more are
+    logged as likely N+1 patterns. The aggregates are logged every POLLS_METRICS_LOG_INTERVAL
+    seconds and served to staff by polls.views.metrics_view.
+    """
+
+    def __init__(self, get_response):
+        if not settings.POLLS_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        wall_ms = (time.perf_counter() - start) * 1000
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        repeated = metrics.repeated_statements(settings.POLLS_METRICS_N_PLUS_ONE_THRESHOLD)
+        for sql, count in repeated.items():
+            logger.warning("Possible N+1 in %s: %d runs of %s", view_name, count, sql)
+        registry.record(view_name, wall_ms, metrics, repeated)
+        registry.log_if_due(settings.POLLS_METRICS_LOG_INTERVAL)
+        return response
+
+
+class TimedTemplate:
+    """A template of the Django backend that adds its render time to the current request metrics."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = current_metrics.get()
+            if metrics is not None:
+                metrics.template_seconds += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend with render times reported to RequestMetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
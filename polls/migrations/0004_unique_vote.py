@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:29
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """Keep only the latest vote of each user on each question and take the others out of the tallies."""
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    duplicates = (Vote.objects.filter(user__isnull=False, question__isnull=False).order_by()
+                  .values('user', 'question').annotate(latest=Max('pk'), total=Count('pk')).filter(total__gt=1))
+    for row in duplicates.iterator():
+        extra = Vote.objects.filter(user=row['user'], question=row['question']).exclude(pk=row['latest'])
+        for choice_id in extra.values_list('choice', flat=True):
+            Choice.objects.filter(pk=choice_id).update(vote_count=F('vote_count') - 1)
+        Question.objects.filter(pk=row['question']).update(vote_count=F('vote_count') - extra.count())
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_vote_tallies'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='unique_vote_per_user_question'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:10
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_rollup(apps, schema_editor):
+    """Put the existing votes into the rollup, in the minute the migration runs."""
+    Vote = apps.get_model('polls', 'Vote')
+    VoteRollup = apps.get_model('polls', 'VoteRollup')
+    minute = django.utils.timezone.now().replace(second=0, microsecond=0)
+    counts = (Vote.objects.filter(question__isnull=False, choice__isnull=False).order_by()
+              .values_list('question', 'choice').annotate(total=Count('pk')))
+    VoteRollup.objects.bulk_create(
+        (VoteRollup(question_id=question_id, choice_id=choice_id, minute=minute, count=total)
+         for question_id, choice_id, total in counts.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_vote_question_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('question', 'minute', 'choice'),
+                                               name='unique_rollup_per_minute'),
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
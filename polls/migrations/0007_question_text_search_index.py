@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Index question_text case-insensitively so that prefix searches do not scan the table."""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS question_text_nocase_idx ON polls_question (question_text COLLATE NOCASE)")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP INDEX IF EXISTS question_text_nocase_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_vote_timestamps_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.migrations.operations.base import Operation
+
+
+class DropForeignKeysOnShards(Operation):
+    """
+    Drop the foreign key constraints of a model on the vote shards only.
+
+    A shard holds the votes without the users, choices and questions they refer to, so
+    it cannot check these keys. The primary keeps them, and so does the model state.
+    """
+
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name, fields):
+        self.model_name = model_name
+        self.fields = fields
+
+    def deconstruct(self):
+        return self.__class__.__name__, [self.model_name, self.fields], {}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def alter_fields(self, app_label, schema_editor, state, db_constraint):
+        """
+        Set db_constraint on the fields one at a time, so that rebuilding the table for one field keeps the others.
+
+        Returns:
+            ProjectState: the state with the fields altered.
+        """
+        for name in self.fields:
+            field = state.models[app_label, self.model_name].fields[name].clone()
+            field.db_constraint = db_constraint
+            operation = migrations.AlterField(self.model_name, name, field)
+            altered = state.clone()
+            operation.state_forwards(app_label, altered)
+            if schema_editor is not None:
+                operation.database_forwards(app_label, schema_editor, state, altered)
+            state = altered
+        return state
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias in settings.POLLS_VOTE_SHARDS:
+            self.alter_fields(app_label, schema_editor, from_state, db_constraint=False)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias in settings.POLLS_VOTE_SHARDS:
+            unconstrained = self.alter_fields(app_label, None, to_state, db_constraint=False)
+            self.alter_fields(app_label, schema_editor, unconstrained, db_constraint=True)
+
+    def describe(self):
+        return f"Drop the foreign key constraints of {self.model_name} on the vote shards"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0007_question_text_search_index'),
+    ]
+
+    operations = [
+        DropForeignKeysOnShards('vote', ['user', 'choice', 'question']),
+        DropForeignKeysOnShards('voterollup', ['question', 'choice']),
+    ]
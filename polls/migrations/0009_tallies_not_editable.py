@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_vote_shards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='choice',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
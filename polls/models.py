@@ -1,10 +1,74 @@
 """Module for creating question and choice in database."""
+import contextlib
+import contextvars
 import datetime
+from collections import Counter, defaultdict
 
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import F, Q, Sum
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .shards import is_sharded, shard_for
+
+
+_deleting_questions = contextvars.ContextVar('polls_deleting_questions', default=False)
+
+
+@contextlib.contextmanager
+def deleting_questions():
+    """Mark the deletes made inside the block as deletes of whole questions, whose tallies go with them."""
+    token = _deleting_questions.set(True)
+    try:
+        yield
+    finally:
+        _deleting_questions.reset(token)
+
+
+def is_deleting_questions():
+    """Check if the current delete is of whole questions, so their choices and votes need no untallying."""
+    return _deleting_questions.get()
+
+
+class QuestionQuerySet(models.QuerySet):
+    """
+    Filters of questions by their polling period, evaluated by the database.
+
+    Each method takes the `now` to compare against, so that several filters of one
+    request agree on the time. It defaults to the current time.
+    """
+
+    def published(self, now=None):
+        """Questions whose pub_date has passed, open or closed."""
+        return self.filter(pub_date__lte=now or timezone.now())
+
+    def open(self, now=None):
+        """Questions that can be voted on now, as in Question.can_vote."""
+        now = now or timezone.now()
+        return self.filter(pub_date__lte=now, end_date__gte=now)
+
+    def closed(self, now=None):
+        """Published questions whose end_date has passed."""
+        now = now or timezone.now()
+        return self.filter(pub_date__lte=now, end_date__lt=now)
+
+    def upcoming(self, now=None):
+        """Questions that are not published yet."""
+        return self.filter(pub_date__gt=now or timezone.now())
+
+    def with_status(self, now=None):
+        """Annotate is_open, so a single query tells a missing question from one out of its polling period."""
+        now = now or timezone.now()
+        return self.annotate(is_open=models.ExpressionWrapper(Q(pub_date__lte=now, end_date__gte=now),
+                                                              output_field=models.BooleanField()))
+
+    def delete(self):
+        with deleting_questions():
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class Question(models.Model):
     """A class for making a question in database."""
@@ -12,43 +76,65 @@ class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('ending date')
+    # Tallies are only changed by F() updates as votes are cast, never through forms.
+    vote_count = models.IntegerField(default=0, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pub_date'], name='question_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.question_text
 
-    def was_published_recently(self):
+    def delete(self, *args, **kwargs):
+        with deleting_questions():
+            return super().delete(*args, **kwargs)
+
+    def was_published_recently(self, now=None):
         """
         was_published_recently checks if the question is published within 1 day.
 
+        Arguments:
+            now: the time to compare against, the current time by default.
+
         Returns:
             bool: True if the time is less than 1 day, otherwise, False.
         """
-        now = timezone.now()
+        now = now or timezone.now()
         return now - datetime.timedelta(days=1) <= self.pub_date <= now
 
     was_published_recently.admin_order_field = 'pub_date'
     was_published_recently.boolean = True
     was_published_recently.short_description = 'Published recently?'
 
-    def is_published(self):
+    def is_published(self, now=None):
         """
         Check if the question is published.
 
+        Arguments:
+            now: the time to compare against, the current time by default.
+
         Returns:
             bool: True if the question is published, otherwise, False.
         """
-        now = timezone.now()
+        now = now or timezone.now()
         return now >= self.pub_date
 
-    def can_vote(self):
+    def can_vote(self, now=None):
         """
         Check if the question can be voted now.
 
+        Arguments:
+            now: the time to compare against, the current time by default.
+
         Returns:
             bool: True if the question can be voted for now, else, False.
         """
-        now = timezone.now()
-        return self.is_published() and now <= self.end_date
+        now = now or timezone.now()
+        return self.is_published(now) and now <= self.end_date
 
 
 class Choice(models.Model):
@@ -56,14 +142,232 @@ class Choice(models.Model):
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.choice_text
 
 
+def minute_of(moment):
+    """Get the start of the minute a moment falls in."""
+    return moment.replace(second=0, microsecond=0)
+
+
+class VoteManager(models.Manager):
+    """
+    Manager that keeps the choice and question tallies and the rollups in step with the votes.
+
+    The votes of a question are written to the database shard_for gives. The tallies on
+    Question and Choice live on the primary, so they are only kept in the same transaction
+    when the votes are not sharded; with sharded votes the results are summed from the
+    rollups of the shard, and rebuild_tallies refreshes the tallies on the primary.
+    """
+
+    def for_question(self, question_id):
+        """Get the votes of a question from the database that holds them."""
+        queryset = self.filter(question_id=question_id)
+        return queryset.using(shard_for(question_id)) if is_sharded() else queryset
+
+    def choice_of(self, user_id, question_id):
+        """Get the id of the choice a user voted for on a question, or None."""
+        return self.for_question(question_id).filter(user_id=user_id).values_list('choice_id', flat=True).first()
+
+    def cast(self, user_id, question_id, choice_id):
+        """
+        Record the vote of a user and update the tallies and rollup in the same transaction.
+
+        The first vote of a user on a question is a single INSERT ... ON CONFLICT DO NOTHING,
+        which relies on the unique (user, question) constraint, so concurrent submits cannot
+        create duplicate rows. A user who already voted has the vote moved to the new choice,
+        so the old choice goes down by one and the new choice goes up by one.
+
+        Arguments:
+            user_id: the id of the user who votes.
+            question_id: the id of the question that is voted on.
+            choice_id: the id of the selected choice.
+
+        Returns:
+            int: the id of the previously selected choice, or None if this is the first vote.
+        """
+        using = shard_for(question_id)
+        connection = connections[using]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        now = timezone.now()
+        timestamp = connection.ops.adapt_datetimefield_value(now)
+        tallied = using == DEFAULT_DB_ALIAS
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, question_id, choice_id, created, updated) "
+                f"VALUES (%s, %s, %s, %s, %s) ON CONFLICT (user_id, question_id) DO NOTHING",
+                [user_id, question_id, choice_id, timestamp, timestamp])
+            if cursor.rowcount:
+                if tallied:
+                    Question.objects.filter(pk=question_id).update(vote_count=F('vote_count') + 1)
+                    Choice.objects.filter(pk=choice_id).update(vote_count=F('vote_count') + 1)
+                VoteRollup.objects.add({(question_id, choice_id): 1}, now, using)
+                return None
+            votes = self.using(using).filter(user_id=user_id, question_id=question_id)
+            previous_choice_id = votes.select_for_update().values_list('choice_id', flat=True).get()
+            if previous_choice_id != choice_id:
+                votes.update(choice_id=choice_id, updated=now)
+                if tallied:
+                    Choice.objects.filter(pk=previous_choice_id).update(vote_count=F('vote_count') - 1)
+                    Choice.objects.filter(pk=choice_id).update(vote_count=F('vote_count') + 1)
+                VoteRollup.objects.add({(question_id, previous_choice_id): -1, (question_id, choice_id): 1}, now,
+                                       using)
+            return previous_choice_id
+
+    def cast_many(self, votes):
+        """
+        Record a batch of votes and apply their tallies with one update per changed row.
+
+        Arguments:
+            votes: dict that maps (user_id, question_id) to the selected choice id.
+
+        Returns:
+            set: the ids of the questions whose tallies changed.
+        """
+        shards = defaultdict(dict)
+        for (user_id, question_id), choice_id in votes.items():
+            shards[shard_for(question_id)][user_id, question_id] = choice_id
+        touched = set()
+        for using, shard_votes in shards.items():
+            touched |= self.cast_many_on(using, shard_votes)
+        return touched
+
+    def cast_many_on(self, using, votes):
+        """Record a batch of votes whose questions all belong to the database `using`, as in cast_many."""
+        users = {user_id for user_id, _ in votes}
+        questions = {question_id for _, question_id in votes}
+        question_deltas = Counter()
+        choice_deltas = Counter()
+        rollup_deltas = Counter()
+        new, changed, touched = [], [], set()
+        now = timezone.now()
+        with transaction.atomic(using=using):
+            existing = {(vote.user_id, vote.question_id): vote
+                        for vote in self.using(using).select_for_update()
+                        .filter(user_id__in=users, question_id__in=questions)}
+            for (user_id, question_id), choice_id in votes.items():
+                vote = existing.get((user_id, question_id))
+                if vote is None or vote.choice_id != choice_id:
+                    touched.add(question_id)
+                if vote is None:
+                    new.append(self.model(user_id=user_id, question_id=question_id, choice_id=choice_id))
+                    question_deltas[question_id] += 1
+                    choice_deltas[choice_id] += 1
+                    rollup_deltas[question_id, choice_id] += 1
+                elif vote.choice_id != choice_id:
+                    choice_deltas[vote.choice_id] -= 1
+                    choice_deltas[choice_id] += 1
+                    rollup_deltas[question_id, vote.choice_id] -= 1
+                    rollup_deltas[question_id, choice_id] += 1
+                    vote.choice_id = choice_id
+                    vote.updated = now
+                    changed.append(vote)
+            self.using(using).bulk_create(new)
+            self.using(using).bulk_update(changed, ['choice', 'updated'])
+            if using == DEFAULT_DB_ALIAS:
+                for model, deltas in ((Question, question_deltas), (Choice, choice_deltas)):
+                    for pk, delta in deltas.items():
+                        if delta:
+                            model.objects.filter(pk=pk).update(vote_count=F('vote_count') + delta)
+            VoteRollup.objects.add(rollup_deltas, now, using)
+        return touched
+
+
 class Vote(models.Model):
     """ A class for voting."""
+
+    # A shard holds votes without the users, choices and questions, so migration 0008 drops
+    # the foreign key constraints there; polls.signals deletes the votes on the shards instead.
     user = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, blank=True, null=True, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, blank=True, null=True, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = VoteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_vote_per_user_question'),
+        ]
+        # The unique constraint already indexes (user, question) for the detail and vote lookups.
+        indexes = [
+            models.Index(fields=['question', 'choice'], name='vote_question_choice_idx'),
+        ]
+
+
+class VoteRollupManager(models.Manager):
+    """Manager for adding vote events to the per-minute rollup."""
+
+    def for_question(self, question_id):
+        """Get the rollup rows of a question from the database that holds them."""
+        queryset = self.filter(question_id=question_id)
+        return queryset.using(shard_for(question_id)) if is_sharded() else queryset
+
+    def tallies(self, question_id):
+        """
+        Sum the rollup of a question into the tally of each choice, reading only the shard of the question.
+
+        Returns:
+            dict: the number of votes of each choice id.
+        """
+        return dict(self.for_question(question_id).order_by().values_list('choice_id').annotate(total=Sum('count')))
+
+    def totals(self, question_ids):
+        """
+        Sum the rollups of several questions into their vote counts, with one query per shard holding any of them.
+
+        With sharding on, these replace the vote_count of the questions, which is only
+        refreshed by rebuild_tallies.
+
+        Returns:
+            dict: the number of votes of each question id that has any.
+        """
+        shards = defaultdict(list)
+        for question_id in question_ids:
+            shards[shard_for(question_id)].append(question_id)
+        totals = {}
+        for using, ids in shards.items():
+            totals.update(self.using(using).filter(question_id__in=ids).order_by().values_list('question_id')
+                          .annotate(total=Sum('count')))
+        return totals
+
+    def add(self, deltas, moment, using=DEFAULT_DB_ALIAS):
+        """
+        Add tally changes to the rollup rows of the minute of `moment`, creating the rows when needed.
+
+        Arguments:
+            deltas: dict that maps (question_id, choice_id) to the change of the tally.
+            moment: when the changes happened.
+            using: the alias of the database of the votes.
+        """
+        rows = [(question_id, choice_id, delta) for (question_id, choice_id), delta in deltas.items() if delta]
+        if not rows:
+            return
+        connection = connections[using]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        minute = connection.ops.adapt_datetimefield_value(minute_of(moment))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (question_id, choice_id, minute, count) VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (question_id, minute, choice_id) DO UPDATE SET count = {table}.count + excluded.count",
+                [(question_id, choice_id, minute, delta) for question_id, choice_id, delta in rows])
+
+
+class VoteRollup(models.Model):
+    """The net change of the tally of a choice within one minute."""
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    minute = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    objects = VoteRollupManager()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'minute', 'choice'], name='unique_rollup_per_minute'),
+        ]
@@ -0,0 +1,98 @@
+"""Module for limiting the rate of requests per user and per IP address."""
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse
+
+RATE_LIMIT_KEY = 'polls:ratelimit:{endpoint}:{scope}:{ident}'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Read a rate such as '10/m'.
+
+    Returns:
+        tuple: the number of requests allowed in a burst and the seconds to refill them.
+
+    Raises:
+        ValueError: if the rate is not a count, a slash and one of s, m, h or d.
+    """
+    try:
+        count, period = rate.split('/')
+        return int(count), PERIODS[period]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid rate: {rate!r}")
+
+
+class TokenBucket:
+    """
+    A token bucket per key, kept in a cache shared by every worker process.
+
+    A bucket holds up to `count` tokens and refills at `count` tokens per `period`
+    seconds. Each request takes a token and is refused when none is left. The state
+    is read and written without a lock, so concurrent requests of one key may let a
+    few more requests through than the rate; it never refuses requests wrongly.
+    """
+
+    def __init__(self, cache, rate):
+        self.cache = cache
+        self.capacity, period = parse_rate(rate)
+        self.refill = self.capacity / period
+
+    def take(self, key, now=None):
+        """
+        Take a token from the bucket of a key.
+
+        Returns:
+            float: 0 if the request is allowed, else the seconds until a token is available.
+        """
+        now = time.time() if now is None else now
+        tokens, stamp = self.cache.get(key) or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - stamp) * self.refill)
+        if tokens < 1:
+            return (1 - tokens) / self.refill
+        timeout = math.ceil(self.capacity / self.refill)
+        self.cache.set(key, (tokens - 1, now), timeout)
+        return 0
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse("Too many requests, please try again later.", status=429)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def rate_limit(endpoint):
+    """
+    Limit a view to the rates of POLLS_RATE_LIMITS[endpoint], per IP address and per user.
+
+    The address is checked first and needs no query, so a flood from one address is
+    refused before the database is touched. The user is read from the session, not from
+    the auth_user table, so the decorator goes outside login_required.
+
+    Arguments:
+        endpoint: the key of the rates in POLLS_RATE_LIMITS.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rates = settings.POLLS_RATE_LIMITS.get(endpoint, {})
+            cache = caches[settings.POLLS_RATE_LIMIT_CACHE]
+            for scope in ('ip', 'user'):
+                if not rates.get(scope):
+                    continue
+                ident = request.META.get('REMOTE_ADDR') if scope == 'ip' else request.session.get(SESSION_KEY)
+                if ident is None:
+                    continue
+                key = RATE_LIMIT_KEY.format(endpoint=endpoint, scope=scope, ident=ident)
+                retry_after = TokenBucket(cache, rates[scope]).take(key)
+                if retry_after:
+                    return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,130 @@
+"""Module for sending the reads of the polls app to read replicas and the votes to their shards."""
+import contextlib
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .shards import SHARDED_MODELS, shard_for
+
+PIN_KEY = 'polls:db:pin:{session}'
+
+_use_replicas = contextvars.ContextVar('polls_use_replicas', default=False)
+
+
+@contextlib.contextmanager
+def use_replicas(enabled=True):
+    """
+    Send the reads of the polls app made inside the block to the replicas, or to the primary.
+
+    Arguments:
+        enabled: False to read from the primary inside a block that reads from the replicas.
+    """
+    token = _use_replicas.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def pin_to_primary(request):
+    """Read from the primary for the session of a request for POLLS_REPLICA_PIN_SECONDS, so it sees its writes."""
+    session_key = request.session.session_key
+    if settings.POLLS_REPLICAS and session_key is not None:
+        cache.set(PIN_KEY.format(session=session_key), True, settings.POLLS_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    """Check if the session of a request wrote recently enough that its reads must go to the primary."""
+    session_key = request.session.session_key
+    return session_key is not None and cache.get(PIN_KEY.format(session=session_key)) is not None
+
+
+def replica_view(view):
+    """
+    Run a view that only reads with the reads of the polls app sent to the replicas.
+
+    The pin is looked up by the session key from the cookie, so checking it neither loads
+    the session nor makes the response vary on the cookie. A session that wrote within
+    the last POLLS_REPLICA_PIN_SECONDS reads from the primary instead.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.POLLS_REPLICAS or is_pinned(request):
+            return view(request, *args, **kwargs)
+        with use_replicas():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Route the reads of POLLS_REPLICA_APPS to a random replica of POLLS_REPLICAS inside use_replicas.
+
+    Everything else, and every write, goes to the primary. Replicas are copies of the
+    primary, so relations between them are allowed and nothing is migrated on them.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.POLLS_REPLICAS
+        if replicas and _use_replicas.get() and model._meta.app_label in settings.POLLS_REPLICA_APPS:
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.POLLS_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.POLLS_REPLICAS:
+            return False
+        return None
+
+
+class VoteShardRouter:
+    """
+    Keep the votes and rollups of each question on its shard of POLLS_VOTE_SHARDS, and nothing else.
+
+    A query is not told its question, so the managers of Vote and VoteRollup pick the shard
+    themselves. The router routes what goes through an instance: the votes of a question or
+    choice go to its shard, a vote is saved on the shard of its question, and the question,
+    choice or user of a vote read from a shard comes from the primary. Only the tables of
+    the sharded models are migrated on the shards.
+    """
+
+    def db_for_instance(self, model, instance):
+        shards = settings.POLLS_VOTE_SHARDS
+        if not shards or instance is None:
+            return None
+        if model._meta.model_name in SHARDED_MODELS:
+            is_question = instance._meta.model_name == 'question'
+            question_id = instance.pk if is_question else getattr(instance, 'question_id', None)
+            return shard_for(question_id) if question_id is not None else None
+        if instance._state.db in shards:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_instance(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_instance(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        shards = settings.POLLS_VOTE_SHARDS
+        if obj1._state.db in shards or obj2._state.db in shards:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.POLLS_VOTE_SHARDS:
+            return app_label == 'polls' and model_name in SHARDED_MODELS
+        return None
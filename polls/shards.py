@@ -0,0 +1,43 @@
+"""Module for spreading the votes of the questions over several databases."""
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SHARDED_MODELS = ('vote', 'voterollup')
+
+
+def is_sharded():
+    """Check if the votes are kept on the shards of POLLS_VOTE_SHARDS rather than on the primary."""
+    return bool(settings.POLLS_VOTE_SHARDS)
+
+
+def vote_databases():
+    """Get the aliases of the databases that hold votes: the shards, or the primary when votes are not sharded."""
+    return list(settings.POLLS_VOTE_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def shard_weight(alias, question_id):
+    """Hash a shard and a question into the number the shard bids for the question."""
+    digest = hashlib.blake2b(f'{alias}:{question_id}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_for(question_id):
+    """
+    Get the database that holds the votes and rollups of a question.
+
+    Each question belongs to the shard with the highest weight for it (rendezvous
+    hashing), so adding a shard only moves the questions the new shard wins, about
+    one in N, and removing one only moves its own questions.
+
+    Arguments:
+        question_id: the id of the question.
+
+    Returns:
+        str: the alias of the shard, or the primary when votes are not sharded.
+    """
+    shards = settings.POLLS_VOTE_SHARDS
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return max(shards, key=lambda alias: shard_weight(alias, question_id))
@@ -0,0 +1,139 @@
+"""Module for keeping the poll caches and the vote shards in step with the database."""
+import functools
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_index_version, invalidate_ballot, invalidate_results_snapshot
+from .eligibility import eligibility_cache
+from .models import Question, Choice, Vote, VoteRollup, is_deleting_questions
+from .shards import is_sharded
+
+
+def after_commit(using, function, *args):
+    """
+    Run `function(*args)` once the current transaction of `using` commits, or now outside a transaction.
+
+    A cache dropped before the commit could be filled again from the old rows by a request
+    arriving in between, and then kept under the new version until it expires.
+    """
+    transaction.on_commit(functools.partial(function, *args), using=using)
+
+
+def invalidate_question_eligibility_now(question_id):
+    """Drop the cached ballot and eligibility of a question right away."""
+    invalidate_ballot(question_id)
+    eligibility_cache.invalidate(question_id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_index(sender, using, **kwargs):
+    """Drop the cached index listing when a question or choice changes."""
+    after_commit(using, bump_index_version)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_results(sender, instance, using, **kwargs):
+    """Drop the cached results of a question that was edited or deleted."""
+    after_commit(using, invalidate_results_snapshot, instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_choice_results(sender, instance, using, **kwargs):
+    """Drop the cached results of the question of a choice that was edited or deleted."""
+    after_commit(using, invalidate_results_snapshot, instance.question_id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_eligibility(sender, instance, using, **kwargs):
+    """Drop the cached ballot and polling period of a question that was edited or deleted."""
+    after_commit(using, invalidate_question_eligibility_now, instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_choice_eligibility(sender, instance, using, **kwargs):
+    """Drop the cached ballot and choice ids of the question of a choice that was added, edited or deleted."""
+    after_commit(using, invalidate_question_eligibility_now, instance.question_id)
+
+
+@receiver(pre_delete, sender=User)
+def untally_user_votes(sender, instance, using, **kwargs):
+    """
+    Take the votes of a user that is about to be deleted out of the tallies and the rollups.
+
+    The votes are counted with one grouped query before the cascade deletes them in bulk,
+    and each question and choice they were for is updated once.
+    """
+    if using != DEFAULT_DB_ALIAS or is_sharded():
+        return
+    votes = (Vote.objects.filter(user_id=instance.pk, question__isnull=False, choice__isnull=False).order_by()
+             .values_list('question_id', 'choice_id').annotate(count=Count('pk')))
+    counts = {(question_id, choice_id): count for question_id, choice_id, count in votes}
+    questions = Counter()
+    for (question_id, choice_id), count in counts.items():
+        questions[question_id] += count
+        Choice.objects.filter(pk=choice_id).update(vote_count=F('vote_count') - count)
+    for question_id, count in questions.items():
+        Question.objects.filter(pk=question_id).update(vote_count=F('vote_count') - count)
+        after_commit(using, invalidate_results_snapshot, question_id)
+    VoteRollup.objects.add({key: -count for key, count in counts.items()}, timezone.now(), using)
+
+
+@receiver(pre_delete, sender=Choice)
+def untally_choice_votes(sender, instance, using, **kwargs):
+    """
+    Take the votes of a choice that is about to be deleted out of the tally of its question.
+
+    The tally and the rollup rows of the choice go with it. Nothing is done when the
+    whole question is being deleted.
+    """
+    if using != DEFAULT_DB_ALIAS or is_sharded() or is_deleting_questions():
+        return
+    count = Vote.objects.filter(choice_id=instance.pk).count()
+    if count:
+        Question.objects.filter(pk=instance.question_id).update(vote_count=F('vote_count') - count)
+
+
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Choice)
+def delete_sharded_votes(sender, instance, **kwargs):
+    """Delete the votes and rollups of a deleted question or choice on its shard, which the cascade does not reach."""
+    if not is_sharded():
+        return
+    if sender is Question:
+        Vote.objects.for_question(instance.pk).delete()
+        VoteRollup.objects.for_question(instance.pk).delete()
+    else:
+        Vote.objects.for_question(instance.question_id).filter(choice_id=instance.pk).delete()
+        VoteRollup.objects.for_question(instance.question_id).filter(choice_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_user_votes(sender, instance, **kwargs):
+    """Delete the votes of a deleted user on every shard, and take them out of the rollups that feed the results."""
+    if not is_sharded():
+        return
+    for using in settings.POLLS_VOTE_SHARDS:
+        with transaction.atomic(using=using):
+            votes = Vote.objects.using(using).filter(user_id=instance.pk)
+            counts = {(question_id, choice_id): count for question_id, choice_id, count
+                      in votes.order_by().values_list('question_id', 'choice_id').annotate(count=Count('pk'))}
+            if not counts:
+                continue
+            VoteRollup.objects.add({key: -count for key, count in counts.items()}, timezone.now(), using)
+            votes.delete()
+            for question_id in {question_id for question_id, _ in counts}:
+                after_commit(using, invalidate_results_snapshot, question_id)
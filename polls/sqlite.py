@@ -0,0 +1,14 @@
+"""Module for tuning SQLite connections."""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Apply POLLS_SQLITE_PRAGMAS to every new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.POLLS_SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
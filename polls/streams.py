@@ -0,0 +1,135 @@
+"""Module for streaming live poll results to clients as Server-Sent Events over ASGI."""
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import get_results_snapshot, snapshot_etag
+
+STREAM_PATH = re.compile(r'^/polls/(?P<pk>\d+)/results/stream/$')
+
+
+class ResultsBroadcaster:
+    """
+    Share one watcher per question between all the clients streaming its results.
+
+    The watcher reads the cached results snapshot every POLLS_STREAM_INTERVAL seconds
+    and pushes it to the clients only when a tally changed, so idle connections cost
+    neither a thread nor a database query.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.watchers = {}
+        self.latest = {}
+
+    def subscribe(self, pk):
+        """
+        Start receiving the results of a question.
+
+        Returns:
+            asyncio.Queue: queue that holds the newest snapshot not yet sent to the client.
+        """
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(pk, set()).add(queue)
+        if pk in self.latest:
+            queue.put_nowait(self.latest[pk])
+        if pk not in self.watchers:
+            self.watchers[pk] = asyncio.ensure_future(self.watch(pk))
+        return queue
+
+    def unsubscribe(self, pk, queue):
+        """Stop receiving the results of a question, and stop watching it when nobody listens."""
+        subscribers = self.subscribers.get(pk, set())
+        subscribers.discard(queue)
+        if not subscribers:
+            self.subscribers.pop(pk, None)
+            self.latest.pop(pk, None)
+            watcher = self.watchers.pop(pk, None)
+            if watcher is not None:
+                watcher.cancel()
+
+    def publish(self, pk, snapshot):
+        """Give a snapshot to every subscriber, replacing any snapshot it has not sent yet."""
+        self.latest[pk] = snapshot
+        for queue in self.subscribers.get(pk, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+    async def watch(self, pk):
+        """Publish the results of a question whenever its tallies change."""
+        etag = None
+        while True:
+            snapshot = await sync_to_async(get_results_snapshot, thread_sensitive=False)(pk)
+            if snapshot is not None and snapshot_etag(snapshot) != etag:
+                etag = snapshot_etag(snapshot)
+                self.publish(pk, snapshot)
+            await asyncio.sleep(settings.POLLS_STREAM_INTERVAL)
+
+
+broadcaster = ResultsBroadcaster()
+
+
+async def wait_for_disconnect(receive):
+    """Wait until the client closes the connection."""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def results_stream(scope, receive, send, pk):
+    """
+    Stream the results of a question as Server-Sent Events.
+
+    Arguments:
+        scope: the ASGI connection scope.
+        receive: the ASGI receive callable.
+        send: the ASGI send callable.
+        pk: the id of the question.
+    """
+    if await sync_to_async(get_results_snapshot, thread_sensitive=False)(pk) is None:
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': b'No question found matching the query'})
+        return
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')]})
+    queue = broadcaster.subscribe(pk)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        while not disconnected.done():
+            update = asyncio.ensure_future(queue.get())
+            await asyncio.wait({update, disconnected}, timeout=settings.POLLS_STREAM_HEARTBEAT,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if update.done():
+                body = f"event: results\ndata: {json.dumps(update.result())}\n\n".encode()
+            else:
+                update.cancel()
+                body = b": keep-alive\n\n"
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(pk, queue)
+        disconnected.cancel()
+
+
+def stream_router(application):
+    """
+    Wrap an ASGI application so the results streams are served without going through Django.
+
+    Arguments:
+        application: the Django ASGI application that serves every other request.
+
+    Returns:
+        The wrapping ASGI application.
+    """
+    async def router(scope, receive, send):
+        if scope['type'] == 'http':
+            match = STREAM_PATH.match(scope['path'])
+            if match:
+                return await results_stream(scope, receive, send, int(match['pk']))
+        return await application(scope, receive, send)
+    return router
@@ -0,0 +1,22 @@
+"""Module for running the tests without touching the production audit log."""
+import os
+import tempfile
+
+from django.test.runner import DiscoverRunner
+
+from polls.audit import use_audit_log
+
+
+class PollsTestRunner(DiscoverRunner):
+    """A test runner that writes the audit log to a temporary directory instead of POLLS_AUDIT_LOG_PATH."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.audit_directory = tempfile.TemporaryDirectory(prefix='ku-polls-audit-')
+        use_audit_log(os.path.join(self.audit_directory.name, 'audit.log'))
+
+    def teardown_test_environment(self, **kwargs):
+        # Switching files writes the events still queued, so nothing is written after the cleanup.
+        use_audit_log(os.path.join(self.audit_directory.name, 'audit.log'))
+        self.audit_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
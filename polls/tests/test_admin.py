@@ -0,0 +1,77 @@
+"""Module for testing the question changelist of the admin."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Question, Vote
+
+
+class QuestionAdminTests(TestCase):
+    """A class for checking that the changelist columns come from one query."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='secret')
+        self.client.force_login(self.admin)
+        now = timezone.now()
+        for days in range(-20, 0):
+            question = Question.objects.create(question_text=f"Question {days}",
+                                               pub_date=now + datetime.timedelta(days=days),
+                                               end_date=now + datetime.timedelta(days=days + 10))
+            Choice.objects.create(question=question, choice_text="Yes")
+        self.open_question = Question.objects.create(question_text="Open question.", pub_date=now,
+                                                     end_date=now + datetime.timedelta(days=1))
+        choice = Choice.objects.create(question=self.open_question, choice_text="Yes")
+        Vote.objects.cast(self.admin.id, self.open_question.id, choice.id)
+
+    def test_changelist_query_count(self):
+        """The number of queries does not grow with the number of questions listed."""
+        url = reverse('admin:polls_question_changelist')
+        self.client.get(url)
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        Question.objects.create(question_text="One more.", pub_date=timezone.now(), end_date=timezone.now())
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_changelist_columns(self):
+        """The vote total and the open flag are annotated on the listed questions."""
+        response = self.client.get(reverse('admin:polls_question_changelist'))
+        listed = {question.pk: question for question in response.context['cl'].result_list}
+        self.assertEqual(listed[self.open_question.pk].vote_count, 1)
+        self.assertTrue(listed[self.open_question.pk].is_open)
+        self.assertEqual(sum(question.is_open for question in listed.values()), 10)
+
+    def test_search_matches_prefix(self):
+        """The search matches the start of the question text, ignoring case."""
+        response = self.client.get(reverse('admin:polls_question_changelist'), {'q': 'open'})
+        self.assertEqual([question.pk for question in response.context['cl'].result_list], [self.open_question.pk])
+
+    def test_edit_keeps_tallies(self):
+        """Editing a question and its choice during a poll keeps the votes cast while the form was open."""
+        url = reverse('admin:polls_question_change', args=(self.open_question.pk,))
+        response = self.client.get(url)
+        self.assertNotIn('vote_count', response.context['adminform'].form.fields)
+        self.assertNotIn('vote_count', response.context['inline_admin_formsets'][0].formset.forms[0].fields)
+        choice = self.open_question.choice_set.get()
+        Vote.objects.cast(User.objects.create_user(username='late').id, self.open_question.id, choice.id)
+        pub_date = timezone.localtime(self.open_question.pub_date)
+        end_date = timezone.localtime(self.open_question.end_date)
+        response = self.client.post(url, {
+            'question_text': "Open question, fixed.",
+            'pub_date_0': pub_date.strftime('%Y-%m-%d'), 'pub_date_1': pub_date.strftime('%H:%M:%S'),
+            'end_date_0': end_date.strftime('%Y-%m-%d'), 'end_date_1': end_date.strftime('%H:%M:%S'),
+            'choice_set-TOTAL_FORMS': 1, 'choice_set-INITIAL_FORMS': 1,
+            'choice_set-MIN_NUM_FORMS': 0, 'choice_set-MAX_NUM_FORMS': 1000,
+            'choice_set-0-id': choice.pk, 'choice_set-0-question': self.open_question.pk,
+            'choice_set-0-choice_text': "Yes, fixed",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.open_question.refresh_from_db()
+        choice.refresh_from_db()
+        self.assertEqual(self.open_question.question_text, "Open question, fixed.")
+        self.assertEqual(choice.choice_text, "Yes, fixed")
+        self.assertEqual((self.open_question.vote_count, choice.vote_count), (2, 2))
@@ -0,0 +1,109 @@
+"""Module for testing the audit log."""
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.audit import AuditQueueHandler, logger as audit_logger
+from polls.models import Choice
+from polls.tests.test_detail_view import create_question
+
+
+class AuditHandlerTests(TestCase):
+    """A class for checking the queue handler and its background writer."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'audit.log')
+        self.logger = logging.getLogger('polls.tests.audit')
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_writes_json_lines(self):
+        """Events are written by the background thread as one JSON object per line."""
+        handler = AuditQueueHandler(self.path, batch_size=10)
+        self.logger.addHandler(handler)
+        try:
+            for number in range(25):
+                self.logger.warning('vote', extra={'audit': {'number': number}})
+        finally:
+            self.logger.removeHandler(handler)
+            handler.close()
+        with open(self.path) as log:
+            entries = [json.loads(line) for line in log]
+        self.assertEqual([entry['number'] for entry in entries], list(range(25)))
+        self.assertEqual(entries[0]['event'], 'vote')
+        self.assertEqual(entries[0]['level'], 'WARNING')
+
+    def test_full_queue_drops(self):
+        """With the queue full, events are dropped and counted instead of blocking."""
+        handler = AuditQueueHandler(self.path, queue_size=2)
+        handler.started = True
+        self.logger.addHandler(handler)
+        try:
+            for number in range(5):
+                self.logger.warning('vote', extra={'audit': {'number': number}})
+        finally:
+            self.logger.removeHandler(handler)
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(handler.queue.qsize(), 2)
+
+    def test_set_filename(self):
+        """Queued events go to the old file and later events to the new one."""
+        handler = AuditQueueHandler(self.path)
+        self.logger.addHandler(handler)
+        moved = os.path.join(self.directory.name, 'moved.log')
+        try:
+            self.logger.warning('before')
+            handler.set_filename(moved)
+            self.logger.warning('after')
+        finally:
+            self.logger.removeHandler(handler)
+            handler.close()
+        for path, event in [(self.path, 'before'), (moved, 'after')]:
+            with open(path) as log:
+                self.assertEqual([json.loads(line)['event'] for line in log], [event])
+
+    def test_tests_use_temporary_log(self):
+        """The test runner keeps the audit log of the tests out of the project directory."""
+        filenames = [handler.file_handler.baseFilename for handler in audit_logger.handlers
+                     if isinstance(handler, AuditQueueHandler)]
+        self.assertTrue(filenames)
+        for filename in filenames:
+            self.assertFalse(filename.startswith(str(settings.BASE_DIR)))
+
+
+class AuditEventTests(TestCase):
+    """A class for checking which events are audited."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='jack', password='secret')
+
+    def test_login_events(self):
+        """Logins, failed logins and logouts are audited once each, with the IP address."""
+        with self.assertLogs('polls.audit') as logs:
+            self.client.post(reverse('login'), {'username': 'jack', 'password': 'wrong'})
+            self.client.post(reverse('login'), {'username': 'jack', 'password': 'secret'})
+            self.client.get(reverse('logout'))
+        self.assertEqual([record.getMessage() for record in logs.records], ['login_failed', 'login', 'logout'])
+        self.assertEqual(logs.records[0].audit, {'user': 'jack', 'ip': '127.0.0.1'})
+
+    def test_vote_event(self):
+        """A vote is audited with the previous choice."""
+        question = create_question(question_text="Audited question.", days=-1)
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        self.client.force_login(self.user)
+        with self.assertLogs('polls.audit') as logs:
+            self.client.post(reverse('polls:vote', args=(question.pk,)), {'choice': choice.pk})
+        self.assertEqual(logs.records[-1].audit, {'user_id': self.user.pk, 'question_id': question.pk,
+                                                  'choice_id': choice.pk, 'previous_choice_id': None,
+                                                  'ip': '127.0.0.1'})
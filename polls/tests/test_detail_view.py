@@ -1,12 +1,13 @@
 """Module for testing the detail view."""
 import datetime
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 
-from polls.models import Question
+from polls.models import Question, Choice, Vote
 
 
 def create_question(question_text, days):
@@ -27,6 +28,7 @@ class QuestionDetailViewTests(TestCase):
     """A class for checking detail view."""
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='username', email='someemail@mail.com', password='qwerxhucj12')
         # self.user.first_name = "testuser"
         # self.user.last_name = "hello"
@@ -47,3 +49,29 @@ class QuestionDetailViewTests(TestCase):
         url = reverse('polls:detail', args=(past_question.id,))
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
+
+    def test_detail_query_budget(self):
+        """
+        An authenticated detail page costs the user, the question with its vote and the choices.
+
+        The session is not queried.
+        """
+        self.client.login(username='username', password='qwerxhucj12')
+        question = create_question(question_text="Budget question.", days=-5)
+        choices = [Choice.objects.create(question=question, choice_text=f"Choice {i}") for i in range(5)]
+        Vote.objects.cast(self.user.id, question.id, choices[2].id)
+        url = reverse('polls:detail', args=(question.id,))
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.context['voted_choice'], choices[2].id)
+        self.assertContains(response, f'value="{choices[2].id}" checked')
+        with self.assertNumQueries(2):
+            # The choices now come from the cached ballot.
+            response = self.client.get(url)
+        self.assertContains(response, f'value="{choices[2].id}" checked')
+
+    def test_missing_question(self):
+        """The detail view of a question that does not exist returns 404."""
+        self.client.login(username='username', password='qwerxhucj12')
+        response = self.client.get(reverse('polls:detail', args=(999,)))
+        self.assertEqual(response.status_code, 404)
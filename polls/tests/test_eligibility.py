@@ -0,0 +1,114 @@
+"""Module for testing the in-process vote eligibility cache."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.eligibility import EligibilityCache, eligibility_cache
+from polls.models import Choice, Vote
+from polls.tests.test_detail_view import create_question
+
+
+class EligibilityCacheTests(TestCase):
+    """A class for checking the LRU, TTL and signal invalidation of the eligibility cache."""
+
+    def setUp(self):
+        cache.clear()
+        eligibility_cache.clear()
+        self.question = create_question(question_text="Cached question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+
+    def test_hit_needs_no_query(self):
+        """A question read once is checked again without queries."""
+        local = EligibilityCache(max_size=10, ttl=60)
+        local.get(self.question.pk)
+        with self.assertNumQueries(0):
+            eligibility = local.get(self.question.pk)
+        self.assertEqual(eligibility.choice_ids, {self.choice.pk})
+        self.assertTrue(eligibility.can_vote())
+        self.assertEqual(local.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_missing_question(self):
+        """A missing question is cached as None."""
+        local = EligibilityCache(max_size=10, ttl=60)
+        self.assertIsNone(local.get(self.question.pk + 1))
+        with self.assertNumQueries(0):
+            self.assertIsNone(local.get(self.question.pk + 1))
+
+    def test_least_recently_used_is_evicted(self):
+        """The least recently used question goes first once the cache is full."""
+        other = create_question(question_text="Other.", days=-1)
+        third = create_question(question_text="Third.", days=-1)
+        local = EligibilityCache(max_size=2, ttl=60)
+        local.get(self.question.pk)
+        local.get(other.pk)
+        local.get(self.question.pk)
+        local.get(third.pk)
+        self.assertEqual(list(local.entries), [self.question.pk, third.pk])
+
+    def test_expired_entry_is_read_again(self):
+        """An entry past its time to live is loaded again."""
+        local = EligibilityCache(max_size=10, ttl=0)
+        local.get(self.question.pk)
+        local.get(self.question.pk)
+        self.assertEqual(local.stats()['misses'], 2)
+
+    def test_miss_reads_shared_ballot(self):
+        """A process that has not seen a question reads it from the shared cache, without queries."""
+        EligibilityCache(max_size=10, ttl=60).get(self.question.pk)
+        with self.assertNumQueries(0):
+            eligibility = EligibilityCache(max_size=10, ttl=60).get(self.question.pk)
+        self.assertEqual(eligibility.choice_ids, {self.choice.pk})
+
+    def test_signals_invalidate(self):
+        """Adding a choice or moving the end date shows on the next check."""
+        eligibility_cache.get(self.question.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            choice = Choice.objects.create(question=self.question, choice_text="No")
+        self.assertIn(choice.pk, eligibility_cache.get(self.question.pk).choice_ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.end_date = timezone.now() - datetime.timedelta(seconds=1)
+            self.question.save()
+        self.assertFalse(eligibility_cache.get(self.question.pk).can_vote())
+
+
+class CachedVoteTests(TestCase):
+    """A class for checking that a vote is checked without reading the question or choice."""
+
+    def setUp(self):
+        cache.clear()
+        eligibility_cache.clear()
+        self.user = User.objects.create_user(username='voter', password='secret')
+        self.client.force_login(self.user)
+        self.question = create_question(question_text="Vote question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.url = reverse('polls:vote', args=(self.question.pk,))
+
+    def test_vote_reads_no_poll_rows(self):
+        """With the question cached, a vote reads neither the question nor its choices."""
+        self.client.post(self.url, {'choice': self.choice.pk})
+        Vote.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'choice': self.choice.pk})
+        reads = [query['sql'] for query in queries.captured_queries
+                 if query['sql'].startswith('SELECT') and '"polls_' in query['sql']]
+        self.assertEqual(reads, [])
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.pk,)))
+        self.assertEqual(Vote.objects.get().choice_id, self.choice.pk)
+
+    def test_invalid_choice(self):
+        """A choice of another question is refused."""
+        other = Choice.objects.create(question=create_question(question_text="Other.", days=-1), choice_text="No")
+        response = self.client.post(self.url, {'choice': other.pk})
+        self.assertContains(response, "You didn&#x27;t select a choice.")
+        self.assertFalse(Vote.objects.exists())
+
+    def test_missing_question(self):
+        """Voting on a missing question is not found."""
+        response = self.client.post(reverse('polls:vote', args=(self.question.pk + 1,)), {'choice': 1})
+        self.assertEqual(response.status_code, 404)
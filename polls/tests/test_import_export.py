@@ -0,0 +1,111 @@
+"""Module for testing the import_polls and export_polls commands."""
+import csv
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from polls.models import Question, Choice, Vote
+
+POLLS_JSONL = '''{"question_text": "Favourite colour?", "pub_date": "2020-01-01T00:00:00+00:00", \
+"end_date": "2020-02-01T00:00:00+00:00", "choices": ["Red", "Green", "Blue"]}
+{"question_text": "Favourite food?", "pub_date": "2021-01-01T00:00:00+00:00", \
+"end_date": "2021-02-01T00:00:00+00:00", "choices": ["Rice", "Noodles"]}
+'''
+
+POLLS_CSV = '''question_text,pub_date,end_date,choice_text
+Favourite colour?,2020-01-01T00:00:00+00:00,2020-02-01T00:00:00+00:00,Red
+Favourite colour?,2020-01-01T00:00:00+00:00,2020-02-01T00:00:00+00:00,Green
+Favourite food?,2021-01-01T00:00:00+00:00,2021-02-01T00:00:00+00:00,Rice
+'''
+
+
+class ImportExportTests(TestCase):
+    """A class for checking bulk import and streaming export."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, text):
+        path = self.directory / name
+        path.write_text(text)
+        return str(path)
+
+    def test_import_jsonl_in_batches(self):
+        """Questions and their choices are imported batch by batch."""
+        call_command('import_polls', self.write('polls.jsonl', POLLS_JSONL), batch_size=1, stdout=StringIO())
+        food = Question.objects.get(question_text="Favourite food?")
+        self.assertEqual(list(food.choice_set.values_list('choice_text', flat=True)), ["Rice", "Noodles"])
+        self.assertEqual(Choice.objects.count(), 5)
+
+    def test_import_csv(self):
+        """Consecutive CSV rows of the same question become one question with several choices."""
+        call_command('import_polls', self.write('polls.csv', POLLS_CSV), stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 2)
+        colour = Question.objects.get(question_text="Favourite colour?")
+        self.assertEqual(colour.choice_set.count(), 2)
+
+    def test_export_date_range_with_votes(self):
+        """The export holds the questions of the range, their choices and their votes."""
+        call_command('import_polls', self.write('polls.jsonl', POLLS_JSONL), stdout=StringIO())
+        food = Question.objects.get(question_text="Favourite food?")
+        user = User.objects.create_user(username='voter')
+        Vote.objects.cast(user.id, food.id, food.choice_set.first().id)
+        output, votes = self.directory / 'out.jsonl', self.directory / 'votes.jsonl'
+        call_command('export_polls', str(output), since='2020-06-01', votes=str(votes), chunk_size=1,
+                     stderr=StringIO())
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        self.assertEqual([record['question_text'] for record in records], ["Favourite food?"])
+        self.assertEqual([choice['choice_text'] for choice in records[0]['choices']], ["Rice", "Noodles"])
+        self.assertEqual(json.loads(votes.read_text())['user_id'], user.id)
+
+    def test_csv_round_trip(self):
+        """A CSV export can be imported again."""
+        call_command('import_polls', self.write('polls.csv', POLLS_CSV), stdout=StringIO())
+        output = self.directory / 'out.csv'
+        call_command('export_polls', str(output), stderr=StringIO())
+        Question.objects.all().delete()
+        call_command('import_polls', str(output), stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(Choice.objects.count(), 3)
+
+    def test_csv_links_votes_to_questions(self):
+        """The CSV export has the question ids that the question_id of the exported votes refers to."""
+        call_command('import_polls', self.write('polls.csv', POLLS_CSV), stdout=StringIO())
+        food = Question.objects.get(question_text="Favourite food?")
+        Vote.objects.cast(User.objects.create_user(username='voter').id, food.id, food.choice_set.get().id)
+        output, votes = self.directory / 'out.csv', self.directory / 'votes.csv'
+        call_command('export_polls', str(output), votes=str(votes), stderr=StringIO())
+        with output.open() as questions, votes.open() as vote_lines:
+            ids = {row['question_text']: row['id'] for row in csv.DictReader(questions)}
+            self.assertEqual([row['question_id'] for row in csv.DictReader(vote_lines)], [ids["Favourite food?"]])
+
+    def test_votes_join_exported_choices(self):
+        """Each exported vote refers to an exported choice in both formats, and the exports import again."""
+        call_command('import_polls', self.write('polls.jsonl', POLLS_JSONL), stdout=StringIO())
+        voters = [User.objects.create_user(username=f'voter{number}') for number in range(3)]
+        for voter, choice in zip(voters, Choice.objects.order_by('pk')):
+            Vote.objects.cast(voter.id, choice.question_id, choice.id)
+        for file_format in ['jsonl', 'csv']:
+            output, votes = self.directory / f'out.{file_format}', self.directory / f'votes.{file_format}'
+            call_command('export_polls', str(output), votes=str(votes), stderr=StringIO())
+            with output.open() as questions, votes.open() as vote_lines:
+                if file_format == 'csv':
+                    choices = {(row['id'], row['choice_id']): row['choice_text'] for row in csv.DictReader(questions)}
+                    rows = list(csv.DictReader(vote_lines))
+                else:
+                    choices = {(str(record['id']), str(choice['id'])): choice['choice_text']
+                               for record in map(json.loads, questions) for choice in record['choices']}
+                    rows = [{key: str(value) for key, value in json.loads(line).items()} for line in vote_lines]
+            self.assertEqual(sorted(choices[row['question_id'], row['choice_id']] for row in rows),
+                             ["Blue", "Green", "Red"])
+        for file_format in ['jsonl', 'csv']:
+            Question.objects.all().delete()
+            call_command('import_polls', str(self.directory / f'out.{file_format}'), stdout=StringIO())
+            self.assertEqual(Choice.objects.count(), 5)
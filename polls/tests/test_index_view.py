@@ -1,11 +1,13 @@
 """Module for testing index view."""
 import datetime
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 from django.urls import reverse
 
-from polls.models import Question
+from polls.cache import seconds_until_next_boundary
+from polls.models import Question, Choice
 
 
 def create_question(question_text, days):
@@ -25,6 +27,9 @@ def create_question(question_text, days):
 class QuestionIndexViewTests(TestCase):
     """A class for checking index view."""
 
+    def setUp(self):
+        cache.clear()
+
     def test_past_question(self):
         """Questions with a pub_date in the past are displayed on the index page."""
         create_question(question_text="Past question.", days=-30)
@@ -59,4 +64,69 @@ class QuestionIndexViewTests(TestCase):
                         days=30)
         response = self.client.get(reverse('polls:index'))
         self.assertContains(response, "No polls are available.")
-        self.assertQuerysetEqual(response.context['question_list'], [])
\ No newline at end of file
+        self.assertQuerysetEqual(response.context['question_list'], [])
+
+    def test_question_links(self):
+        """Each listed question links to its detail and results pages."""
+        question = create_question(question_text="Linked question.", days=-1)
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, f'href="{reverse("polls:detail", args=(question.id,))}"')
+        self.assertContains(response, f'href="{reverse("polls:results", args=(question.id,))}"')
+
+    def test_closed_question(self):
+        """Questions whose end_date has passed aren't displayed on the index page."""
+        create_question(question_text="Open question.", days=-5)
+        Question.objects.create(question_text="Closed question.", pub_date=timezone.now() - datetime.timedelta(days=5),
+                                end_date=timezone.now() - datetime.timedelta(days=1))
+        response = self.client.get(reverse('polls:index'))
+        self.assertQuerysetEqual(response.context['question_list'], ['<Question: Open question.>'])
+
+
+class QuestionIndexCacheTests(TestCase):
+    """A class for checking the cached question list of the index view."""
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Cached question.", days=-1)
+
+    def test_cached_list_skips_queries(self):
+        """The second request renders the list from the cache without querying questions."""
+        self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Cached question.")
+
+    def test_question_save_invalidates(self):
+        """Saving a question shows the change on the next request."""
+        self.client.get(reverse('polls:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.question_text = "Renamed question."
+            self.question.save()
+        self.assertContains(self.client.get(reverse('polls:index')), "Renamed question.")
+
+    def test_invalidates_after_commit(self):
+        """The listing is only dropped once the change commits, so no request caches the old rows as new."""
+        self.client.get(reverse('polls:index'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.question.question_text = "Renamed question."
+            self.question.save()
+            self.assertNotContains(self.client.get(reverse('polls:index')), "Renamed question.")
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(reverse('polls:index')), "Renamed question.")
+
+    def test_choice_delete_invalidates(self):
+        """Deleting a choice moves the index to a new version."""
+        choice = Choice.objects.create(question=self.question, choice_text="Choice")
+        self.client.get(reverse('polls:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            choice.delete()
+        with self.assertNumQueries(2):
+            self.client.get(reverse('polls:index'))
+
+    def test_expires_at_next_boundary(self):
+        """The list expires when the next question is published."""
+        now = timezone.now()
+        Question.objects.create(question_text="Soon.", pub_date=now + datetime.timedelta(seconds=90),
+                                end_date=now + datetime.timedelta(days=1))
+        self.assertEqual(seconds_until_next_boundary(now), 90)
@@ -0,0 +1,61 @@
+"""Module for testing the request metrics middleware."""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from polls.metrics import registry, RequestMetrics, RequestMetricsMiddleware
+from polls.models import Choice
+from polls.tests.test_detail_view import create_question
+
+
+class RequestMetricsTests(TestCase):
+    """A class for checking what the middleware records."""
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_records_view(self):
+        """A request is recorded under its view name with its queries and template time."""
+        create_question(question_text="Measured question.", days=-1)
+        self.client.get(reverse('polls:index'))
+        view = registry.snapshot()['polls:index']
+        self.assertEqual(view['requests'], 1)
+        self.assertEqual(sum(view['queries']['buckets'].values()), 1)
+        self.assertGreater(view['queries']['sum'], 0)
+        self.assertGreater(view['template_ms'], 0)
+        self.assertEqual(view['n_plus_one'], 0)
+
+    def test_flags_repeated_statements(self):
+        """A request that runs the same SQL with different parameters is flagged as a possible N+1."""
+        question = create_question(question_text="Measured question.", days=-1)
+        choices = [Choice.objects.create(question=question, choice_text=str(i)) for i in range(5)]
+
+        def get_response(request):
+            for choice in choices:
+                Choice.objects.get(pk=choice.pk)
+            return HttpResponse()
+
+        with self.assertLogs('polls.metrics', 'WARNING') as logs:
+            RequestMetricsMiddleware(get_response)(RequestFactory().get('/'))
+        self.assertIn("5 runs of", logs.output[0])
+        self.assertEqual(registry.snapshot()['unresolved']['n_plus_one'], 1)
+
+    def test_repeated_statements_threshold(self):
+        """Statements that run fewer times than the threshold are not reported."""
+        metrics = RequestMetrics()
+        metrics.statements.update({'SELECT 1': 4, 'SELECT 2': 5})
+        self.assertEqual(metrics.repeated_statements(5), {'SELECT 2': 5})
+
+    def test_metrics_endpoint_is_staff_only(self):
+        """Only staff can read the aggregated metrics."""
+        User.objects.create_user(username='voter', password='qwerxhucj12')
+        User.objects.create_user(username='admin', password='qwerxhucj12', is_staff=True)
+        self.client.login(username='voter', password='qwerxhucj12')
+        self.assertEqual(self.client.get(reverse('polls:metrics')).status_code, 302)
+        self.client.login(username='admin', password='qwerxhucj12')
+        response = self.client.get(reverse('polls:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('views', response.json())
@@ -0,0 +1,71 @@
+"""Module for testing the keyset pagination of the index."""
+import datetime
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question
+from polls.pagination import KeysetPage, decode_cursor, encode_cursor
+
+
+@override_settings(POLLS_INDEX_PAGE_SIZE=3)
+class KeysetPaginationTests(TestCase):
+    """A class for checking that the index pages through the open polls on (pub_date, id)."""
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        end_date = now + datetime.timedelta(days=1)
+        # Two questions share every pub_date, so the id has to break the ties.
+        self.questions = [Question.objects.create(question_text=f"Question {i}", end_date=end_date,
+                                                  pub_date=now - datetime.timedelta(hours=i // 2))
+                          for i in range(8)]
+
+    def walk(self):
+        """Follow the next cursors of the JSON listing to the end and give the ids in order."""
+        ids, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(reverse('polls:index_json'), {'cursor': cursor}).json()
+            self.assertLessEqual(len(data['questions']), 3)
+            ids.extend(question['id'] for question in data['questions'])
+            cursor = data['next']
+        return ids
+
+    def test_pages_cover_every_question_once(self):
+        """The pages list every open question once, newest first."""
+        expected = [question.pk for question in sorted(self.questions, key=lambda q: (q.pub_date, q.pk),
+                                                       reverse=True)]
+        self.assertEqual(self.walk(), expected)
+
+    def test_cursor_is_stable(self):
+        """A new question does not shift the pages after an existing cursor."""
+        first = self.client.get(reverse('polls:index_json')).json()
+        second = self.client.get(reverse('polls:index_json'), {'cursor': first['next']}).json()
+        Question.objects.create(question_text="Newest.", pub_date=timezone.now(),
+                                end_date=timezone.now() + datetime.timedelta(days=1))
+        again = self.client.get(reverse('polls:index_json'), {'cursor': first['next']}).json()
+        self.assertEqual(again, second)
+
+    def test_query_count_does_not_depend_on_depth(self):
+        """A deep page costs one query, like the first page."""
+        last = sorted(self.questions, key=lambda q: (q.pub_date, q.pk))[1]
+        with self.assertNumQueries(1):
+            self.client.get(reverse('polls:index_json'), {'cursor': encode_cursor(last)})
+
+    def test_html_pages(self):
+        """The index links to the next page until the last one."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(len(response.context['question_list']), 3)
+        self.assertContains(response, "Older polls")
+        page = KeysetPage(Question.objects.open(), '', 3)
+        response = self.client.get(reverse('polls:index'), {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['question_list']), 3)
+
+    def test_invalid_cursor(self):
+        """A cursor that does not decode is a bad request."""
+        self.assertEqual(self.client.get(reverse('polls:index_json'), {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('polls:index'), {'cursor': 'bm9uc2Vuc2U'}).status_code, 400)
+        with self.assertRaises(ValueError):
+            decode_cursor('')
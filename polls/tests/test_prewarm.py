@@ -0,0 +1,77 @@
+"""Module for testing the warming of caches around poll openings and closings."""
+import datetime
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.cache import BALLOT_KEY, RESULTS_KEY, get_results_snapshot
+from polls.models import Choice, Question
+from polls.warmup import PollScheduler
+
+
+class PollSchedulerTests(TestCase):
+    """A class for checking what the scheduler warms and freezes."""
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+
+    def create(self, text, opens_in, closes_in):
+        question = Question.objects.create(question_text=text,
+                                           pub_date=self.now + datetime.timedelta(seconds=opens_in),
+                                           end_date=self.now + datetime.timedelta(seconds=closes_in))
+        Choice.objects.create(question=question, choice_text="Yes")
+        return question
+
+    def test_warms_questions_about_to_open(self):
+        """A question opening within the lead gets its ballot and empty results cached, once."""
+        soon = self.create("Soon.", 30, 3600)
+        later = self.create("Later.", 600, 3600)
+        scheduler = PollScheduler(lead=60, interval=5)
+        self.assertEqual(scheduler.tick(self.now)['warmed'], [soon.pk])
+        self.assertIsNotNone(cache.get(BALLOT_KEY.format(pk=soon.pk)))
+        self.assertIsNotNone(cache.get(RESULTS_KEY.format(pk=soon.pk)))
+        self.assertIsNone(cache.get(BALLOT_KEY.format(pk=later.pk)))
+        self.assertEqual(scheduler.tick(self.now + datetime.timedelta(seconds=1))['warmed'], [])
+
+    def test_renders_index_after_opening(self):
+        """After a question opens, the first index page is rendered before any visitor asks for it."""
+        opened = self.create("Just opened.", -1, 3600)
+        self.client.get(reverse('polls:index'))
+        self.assertEqual(PollScheduler(lead=60, interval=5).tick(self.now)['opened'], [opened.pk])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Just opened.")
+
+    def test_freezes_closed_results(self):
+        """The results of a question that just closed are stored for good."""
+        closed = self.create("Just closed.", -3600, -1)
+        self.assertEqual(PollScheduler(lead=60, interval=5).tick(self.now)['closed'], [closed.pk])
+        with self.assertNumQueries(0):
+            self.assertTrue(get_results_snapshot(closed.pk)['closed'])
+
+    def test_wakes_at_next_boundary(self):
+        """The scheduler sleeps until the next opening or closing, at most for its interval."""
+        scheduler = PollScheduler(lead=60, interval=5)
+        self.assertEqual(scheduler.seconds_until_next_tick(self.now), 5)
+        self.create("Soon.", 2, 3600)
+        self.assertAlmostEqual(scheduler.seconds_until_next_tick(self.now), 2.001)
+
+    def test_command(self):
+        """prewarm_polls runs one tick and reports it."""
+        soon = self.create("Soon.", 30, 3600)
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+            call_command('prewarm_polls', stdout=output)
+        self.assertIn(f'"warmed": [{soon.pk}]', output.getvalue())
+
+    def test_command_refuses_private_cache(self):
+        """prewarm_polls refuses to warm a cache that no web worker reads."""
+        with self.assertRaisesMessage(CommandError, "private to each process"):
+            call_command('prewarm_polls', stdout=StringIO())
@@ -0,0 +1,46 @@
+"""Module for testing that the hot queries use indexes."""
+import unittest
+
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.utils import timezone
+
+from polls.models import Question, Vote
+from polls.pagination import KeysetPage, encode_cursor
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific.")
+class QueryPlanTests(TestCase):
+    """A class for checking the query plans of the detail, vote, index and results queries."""
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        """Assert that SQLite searches an index instead of scanning the table."""
+        plan = queryset.explain()
+        self.assertIn('USING', plan)
+        self.assertNotRegex(plan, r'SCAN (TABLE )?polls_(vote|question)\b(?! USING)')
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def test_vote_lookup_by_user_and_question(self):
+        """detail_view and vote() find the vote of a user through the unique (user, question) index."""
+        self.assertUsesIndex(Vote.objects.filter(user_id=1, question_id=1))
+
+    def test_published_questions_listing(self):
+        """index_view filters and orders questions through the pub_date index."""
+        queryset = Question.objects.filter(pub_date__lte=timezone.now()).order_by('-pub_date')
+        self.assertUsesIndex(queryset, 'question_pub_date_idx')
+
+    def test_vote_count_per_choice(self):
+        """Counting the votes of a question per choice reads only the (question, choice) index."""
+        queryset = Vote.objects.filter(question_id=1).values('choice').annotate(total=Count('pk')).order_by()
+        self.assertUsesIndex(queryset, 'vote_question_choice_idx')
+
+    def test_admin_question_search(self):
+        """The admin search matches the start of question_text through the case-insensitive index."""
+        self.assertUsesIndex(Question.objects.filter(question_text__istartswith='what'), 'question_text_nocase_idx')
+
+    def test_index_page_after_cursor(self):
+        """A page of the index after a cursor seeks through the pub_date index."""
+        page = KeysetPage(Question.objects.open(), encode_cursor(Question(pk=10, pub_date=timezone.now())), 20)
+        self.assertUsesIndex(page.queryset, 'question_pub_date_idx')
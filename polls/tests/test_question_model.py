@@ -56,4 +56,34 @@ class QuestionModelTests(TestCase):
         """can_vote returns False if it can't be voted (the question is not in the polling period)."""
         time = timezone.now()
         recent_question = Question(pub_date=time, end_date=timezone.now() - datetime.timedelta(days=31))
-        self.assertIs(recent_question.can_vote(), False)
\ No newline at end of file
+        self.assertIs(recent_question.can_vote(), False)
+
+class QuestionQuerySetTests(TestCase):
+    """A test class for checking the polling period filters of the question queryset."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        day = datetime.timedelta(days=1)
+        self.upcoming = Question.objects.create(question_text="Upcoming.", pub_date=self.now + day,
+                                                end_date=self.now + 2 * day)
+        self.open = Question.objects.create(question_text="Open.", pub_date=self.now - day, end_date=self.now + day)
+        self.closed = Question.objects.create(question_text="Closed.", pub_date=self.now - 2 * day,
+                                              end_date=self.now - day)
+
+    def test_filters(self):
+        """Each question falls in exactly one of upcoming, open and closed, matching can_vote."""
+        self.assertEqual(list(Question.objects.upcoming(self.now)), [self.upcoming])
+        self.assertEqual(list(Question.objects.open(self.now)), [self.open])
+        self.assertEqual(list(Question.objects.closed(self.now)), [self.closed])
+        self.assertEqual(set(Question.objects.published(self.now)), {self.open, self.closed})
+        for question in Question.objects.all():
+            self.assertIs(Question.objects.open(self.now).filter(pk=question.pk).exists(), question.can_vote(self.now))
+
+    def test_with_status(self):
+        """with_status annotates whether each question is open at the given time."""
+        status = dict(Question.objects.with_status(self.now).values_list('pk', 'is_open'))
+        self.assertEqual(status, {self.upcoming.pk: False, self.open.pk: True, self.closed.pk: False})
+
+    def test_end_date_boundary(self):
+        """A question can be voted on up to and including its end_date."""
+        self.assertTrue(Question.objects.open(self.open.end_date).filter(pk=self.open.pk).exists())
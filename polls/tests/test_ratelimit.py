@@ -0,0 +1,62 @@
+"""Module for testing the vote rate limits."""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Choice, Vote
+from polls.ratelimit import TokenBucket, parse_rate
+from polls.tests.test_detail_view import create_question
+
+
+class TokenBucketTests(TestCase):
+    """A class for checking the token bucket."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        """A rate is a count over a period of s, m, h or d."""
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        with self.assertRaises(ValueError):
+            parse_rate('10 per minute')
+
+    def test_burst_then_refill(self):
+        """A full bucket allows a burst, then one request per refill interval."""
+        bucket = TokenBucket(cache, '3/m')
+        self.assertEqual([bucket.take('key', now=100) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(bucket.take('key', now=100), 20)
+        self.assertEqual(bucket.take('key', now=110), 10)
+        self.assertEqual(bucket.take('key', now=120), 0)
+        self.assertEqual(bucket.take('other', now=120), 0)
+
+
+@override_settings(POLLS_RATE_LIMITS={'vote': {'ip': '3/m', 'user': '2/m'}})
+class VoteRateLimitTests(TestCase):
+    """A class for checking that the vote endpoint refuses floods before touching the database."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='voter', password='secret')
+        self.question = create_question(question_text="Limited question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.url = reverse('polls:vote', args=(self.question.pk,))
+
+    def test_ip_limit_needs_no_query(self):
+        """Past the rate of an address, requests are refused without any query."""
+        for _ in range(3):
+            self.client.post(self.url, {'choice': self.choice.pk})
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {'choice': self.choice.pk})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        other = self.client.post(self.url, {'choice': self.choice.pk}, REMOTE_ADDR='10.0.0.2')
+        self.assertNotEqual(other.status_code, 429)
+
+    def test_user_limit_across_addresses(self):
+        """A user is limited whatever address the requests come from."""
+        self.client.force_login(self.user)
+        statuses = [self.client.post(self.url, {'choice': self.choice.pk}, REMOTE_ADDR=f'10.0.0.{i}').status_code
+                    for i in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(Vote.objects.count(), 1)
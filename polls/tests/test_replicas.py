@@ -0,0 +1,116 @@
+"""Module for testing the routing of reads to read replicas."""
+import datetime
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.checks import check_shared_cache
+from polls.eligibility import eligibility_cache
+from polls.models import Choice, Question
+from polls.routers import PIN_KEY, ReplicaRouter, use_replicas
+
+
+@override_settings(POLLS_REPLICAS=['replica1', 'replica2'], POLLS_REPLICA_APPS=['polls'])
+class ReplicaRouterTests(SimpleTestCase):
+    """A class for checking where the router sends reads and writes."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_primary_by_default(self):
+        """Outside use_replicas every read goes to the primary."""
+        self.assertIsNone(self.router.db_for_read(Question))
+
+    def test_reads_replica_inside_block(self):
+        """Inside use_replicas the reads of the polls app go to a replica, and those of other apps do not."""
+        with use_replicas():
+            self.assertIn(self.router.db_for_read(Question), ['replica1', 'replica2'])
+            self.assertIsNone(self.router.db_for_read(User))
+            with use_replicas(False):
+                self.assertIsNone(self.router.db_for_read(Question))
+
+    def test_writes_primary(self):
+        """Writes always go to the primary, even inside use_replicas."""
+        with use_replicas():
+            self.assertEqual(self.router.db_for_write(Question), 'default')
+
+    def test_no_migrations_on_replicas(self):
+        """Replicas are copies of the primary, so nothing is migrated on them."""
+        self.assertFalse(self.router.allow_migrate('replica1', 'polls'))
+        self.assertIsNone(self.router.allow_migrate('default', 'polls'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_warns_about_private_cache(self):
+        """Replicas with a cache private to each process are reported by polls.W001."""
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['polls.W001'])
+
+
+REPLICA = 'replica_test'
+
+
+@override_settings(POLLS_REPLICAS=[REPLICA], POLLS_RATE_LIMITS={})
+class ReplicaReadTests(TransactionTestCase):
+    """A class for checking that views read a lagging replica, except right after a write."""
+
+    @classmethod
+    def setUpClass(cls):
+        # The replica is added after the test case guards its databases, and every test
+        # overwrites it from the primary, so it needs neither a test database nor a flush.
+        super().setUpClass()
+        handle, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.databases[REPLICA] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+        os.remove(cls.replica_path)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        eligibility_cache.clear()
+        now = timezone.now()
+        self.question = Question.objects.create(question_text="Replicated question.",
+                                                pub_date=now - datetime.timedelta(days=1),
+                                                end_date=now + datetime.timedelta(days=1))
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        User.objects.create_user(username='voter', password='secret')
+        self.client.login(username='voter', password='secret')
+        call_command('sync_replicas', stdout=StringIO())
+
+    def test_index_json_reads_replica(self):
+        """A question created after the last copy is missing from the lagging replica."""
+        Question.objects.create(question_text="Not copied yet.", pub_date=timezone.now() - datetime.timedelta(hours=1),
+                                end_date=timezone.now() + datetime.timedelta(days=1))
+        response = self.client.get(reverse('polls:index_json'))
+        self.assertEqual([question['question_text'] for question in response.json()['questions']],
+                         ["Replicated question."])
+        call_command('sync_replicas', stdout=StringIO())
+        response = self.client.get(reverse('polls:index_json'))
+        self.assertEqual(len(response.json()['questions']), 2)
+
+    def test_reads_own_vote_after_voting(self):
+        """After a vote the voter reads the primary and sees the vote, until the pin expires."""
+        self.client.post(reverse('polls:vote', args=(self.question.pk,)), {'choice': self.choice.pk})
+        response = self.client.get(reverse('polls:detail', args=(self.question.pk,)))
+        self.assertEqual(response.context['voted_choice'], self.choice.pk)
+        cache.delete(PIN_KEY.format(session=self.client.session.session_key))
+        response = self.client.get(reverse('polls:detail', args=(self.question.pk,)))
+        self.assertIsNone(response.context['voted_choice'])
+
+    def test_vote_writes_primary(self):
+        """Votes are written to the primary and never to the replica."""
+        self.client.post(reverse('polls:vote', args=(self.question.pk,)), {'choice': self.choice.pk})
+        self.assertEqual(self.question.vote_set.count(), 1)
+        self.assertEqual(self.question.vote_set.using(REPLICA).count(), 0)
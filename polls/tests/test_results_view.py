@@ -0,0 +1,180 @@
+"""Module for testing the results view."""
+import asyncio
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.cache import update_results_snapshot
+from polls.eligibility import eligibility_cache
+from polls.models import Question, Choice, Vote
+from polls.streams import stream_router
+from polls.tests.test_detail_view import create_question
+
+
+class ResultsSnapshotTests(TestCase):
+    """A class for checking the cached results snapshots."""
+
+    def setUp(self):
+        cache.clear()
+        eligibility_cache.clear()
+        self.user = User.objects.create_user(username='voter', password='qwerxhucj12')
+        self.question = create_question(question_text="Open question.", days=-1)
+        self.first = Choice.objects.create(question=self.question, choice_text="First")
+        self.second = Choice.objects.create(question=self.question, choice_text="Second")
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def vote(self, choice):
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def test_second_request_skips_queries(self):
+        """The results of a question are read from the cache after the first request."""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "First")
+
+    def test_vote_updates_snapshot_in_place(self):
+        """A vote changes the cached counters, so the next request needs no query."""
+        self.client.login(username='voter', password='qwerxhucj12')
+        self.client.get(self.url)
+        self.vote(self.first)
+        self.vote(self.second)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        choices = {choice['choice_text']: choice['vote_count'] for choice in response.context['choices']}
+        self.assertEqual(choices, {"First": 0, "Second": 1})
+        self.assertEqual(response.context['question']['vote_count'], 1)
+
+    def test_not_modified(self):
+        """A client that sends the ETag back gets 304 until a vote lands."""
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.login(username='voter', password='qwerxhucj12')
+        self.vote(self.first)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_choice_edit_invalidates(self):
+        """Editing a choice shows the new text on the next request."""
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.choice_text = "Renamed"
+            self.first.save()
+        self.assertContains(self.client.get(self.url), "Renamed")
+
+    def test_closed_poll_is_public(self):
+        """The results of a closed poll may be cached by proxies."""
+        closed = Question.objects.create(question_text="Closed.", pub_date=timezone.now() - datetime.timedelta(days=2),
+                                         end_date=timezone.now() - datetime.timedelta(days=1))
+        response = self.client.get(reverse('polls:results', args=(closed.id,)))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('no-cache', self.client.get(self.url)['Cache-Control'])
+
+    def test_missing_question(self):
+        """The results of a question that does not exist return 404."""
+        self.assertEqual(self.client.get(reverse('polls:results', args=(999,))).status_code, 404)
+
+
+class ResultsJsonTests(TestCase):
+    """A class for checking the JSON results endpoint."""
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Json question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Only")
+
+    def test_results_json(self):
+        """The endpoint gives the tallies of every choice as JSON."""
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        data = response.json()
+        self.assertEqual(data['question']['question_text'], "Json question.")
+        self.assertEqual(data['choices'], [{'id': self.choice.id, 'choice_text': "Only", 'vote_count': 0}])
+        self.assertEqual(self.client.get(reverse('polls:results_json', args=(self.question.id,)),
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+@override_settings(POLLS_STREAM_INTERVAL=0.01, POLLS_STREAM_HEARTBEAT=0.05)
+class ResultsStreamTests(TransactionTestCase):
+    """A class for checking the Server-Sent Events results stream."""
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Stream question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Only")
+
+    async def stream(self, path, until):
+        """Run the ASGI application until `until` returns True for the messages sent so far."""
+        sent = []
+        done = asyncio.Event()
+
+        async def receive():
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if until(sent):
+                done.set()
+
+        app = stream_router(None)
+        await asyncio.wait_for(app({'type': 'http', 'path': path}, receive, send), timeout=5)
+        return sent
+
+    def test_pushes_only_changes(self):
+        """The stream sends the results once, then again only after a vote lands."""
+        path = f'/polls/{self.question.id}/results/stream/'
+        events = []
+
+        def until(sent):
+            bodies = [message.get('body', b'') for message in sent[1:]]
+            events[:] = [body for body in bodies if body.startswith(b'event:')]
+            if len(events) == 1 and len(bodies) == 3:
+                update_results_snapshot(self.question.id, None, self.choice.id)
+            return len(events) == 2
+
+        sent = asyncio.run(self.stream(path, until))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'keep-alive', b''.join(message.get('body', b'') for message in sent[1:]))
+        self.assertIn(b'"vote_count": 0', events[0])
+        self.assertIn(b'"vote_count": 1', events[1])
+
+    def test_missing_question(self):
+        """The stream of a question that does not exist answers 404."""
+        sent = asyncio.run(self.stream('/polls/999/results/stream/', lambda sent: True))
+        self.assertEqual(sent[0]['status'], 404)
+
+
+class ResultsCsvTests(TestCase):
+    """A class for checking the staff CSV download of the results."""
+
+    def setUp(self):
+        self.question = create_question(question_text="Csv question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Only")
+        voter = User.objects.create_user(username='voter', password='qwerxhucj12')
+        Vote.objects.cast(voter.id, self.question.id, self.choice.id)
+        User.objects.create_user(username='admin', password='qwerxhucj12', is_staff=True)
+        self.url = reverse('polls:results_csv', args=(self.question.id,))
+
+    def test_staff_only(self):
+        """Visitors who are not staff are sent to the login page."""
+        self.client.login(username='voter', password='qwerxhucj12')
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_tallies(self):
+        """The download streams the tally of each choice."""
+        self.client.login(username='admin', password='qwerxhucj12')
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['choice_id,choice_text,votes', f'{self.choice.id},Only,1'])
+
+    def test_raw_votes(self):
+        """With votes=1 the raw votes follow the tallies."""
+        self.client.login(username='admin', password='qwerxhucj12')
+        content = b''.join(self.client.get(self.url, {'votes': '1'}).streaming_content).decode()
+        self.assertIn(f'voter,{self.choice.id},Only,', content)
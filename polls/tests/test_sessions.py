@@ -0,0 +1,67 @@
+"""Module for testing that page views need no session queries."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Question
+from polls.tests.test_detail_view import create_question
+
+
+def session_queries(captured):
+    """Get the queries of a capture that read or write django_session."""
+    return [query['sql'] for query in captured.captured_queries if 'django_session' in query['sql']]
+
+
+class SessionFastPathTests(TestCase):
+    """A class for checking the session and message storage of page views."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='voter', password='secret')
+        self.question = create_question(question_text="Session question.", days=-1)
+        Choice.objects.create(question=self.question, choice_text="Yes")
+
+    def test_anonymous_results_has_no_session(self):
+        """Anonymous index and results views neither read nor create a session."""
+        with CaptureQueriesContext(connection) as captured:
+            index = self.client.get(reverse('polls:index'))
+            results = self.client.get(reverse('polls:results', args=(self.question.pk,)))
+        self.assertEqual(session_queries(captured), [])
+        for response in (index, results):
+            self.assertNotIn('sessionid', response.cookies)
+        self.assertNotIn('Cookie', results.get('Vary', ''))
+
+    def test_logged_in_views_read_session_from_cache(self):
+        """Once logged in, page views read the session from the cache, not the database."""
+        self.client.login(username='voter', password='secret')
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('polls:index'))
+            self.client.get(reverse('polls:detail', args=(self.question.pk,)))
+        self.assertEqual(session_queries(captured), [])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_database_sessions_cost_a_query_per_view(self):
+        """With database sessions every logged in page view reads django_session, for comparison."""
+        self.client.login(username='voter', password='secret')
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('polls:index'))
+            self.client.get(reverse('polls:detail', args=(self.question.pk,)))
+        self.assertEqual(len(session_queries(captured)), 2)
+
+    def test_polling_period_message_in_cookie(self):
+        """The not in the polling period message travels in a cookie, without touching the session."""
+        closed = Question.objects.create(question_text="Closed.", pub_date=timezone.now() - datetime.timedelta(days=2),
+                                         end_date=timezone.now() - datetime.timedelta(days=1))
+        self.client.login(username='voter', password='secret')
+        with CaptureQueriesContext(connection) as captured:
+            redirect = self.client.get(reverse('polls:detail', args=(closed.pk,)))
+            index = self.client.get(redirect.url)
+        self.assertEqual(session_queries(captured), [])
+        self.assertIn('messages', redirect.cookies)
+        self.assertContains(index, "The question is not in the polling period.")
@@ -0,0 +1,229 @@
+"""Module for testing the sharding of votes by question."""
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.cache import get_results_snapshot
+from polls.eligibility import eligibility_cache
+from polls.models import Choice, Vote, VoteRollup
+from polls.routers import VoteShardRouter
+from polls.shards import shard_for
+from polls.tests.test_detail_view import create_question
+
+
+class ShardResolverTests(SimpleTestCase):
+    """A class for checking which shard owns a question."""
+
+    def test_unsharded_votes_stay_on_primary(self):
+        """Without shards every question belongs to the primary."""
+        with override_settings(POLLS_VOTE_SHARDS=[]):
+            self.assertEqual(shard_for(42), 'default')
+
+    @override_settings(POLLS_VOTE_SHARDS=['votes1', 'votes2'])
+    def test_questions_spread_over_shards(self):
+        """Each question always maps to the same shard, and both shards get questions."""
+        owners = [shard_for(question_id) for question_id in range(1, 201)]
+        self.assertEqual(owners, [shard_for(question_id) for question_id in range(1, 201)])
+        self.assertEqual(set(owners), {'votes1', 'votes2'})
+
+    def test_new_shard_only_takes_questions(self):
+        """Adding a shard moves questions to the new shard only, never between the old ones."""
+        with override_settings(POLLS_VOTE_SHARDS=['votes1', 'votes2']):
+            before = {question_id: shard_for(question_id) for question_id in range(1, 301)}
+        with override_settings(POLLS_VOTE_SHARDS=['votes1', 'votes2', 'votes3']):
+            after = {question_id: shard_for(question_id) for question_id in range(1, 301)}
+        moved = [question_id for question_id in before if before[question_id] != after[question_id]]
+        self.assertTrue(moved)
+        self.assertLess(len(moved), 150)
+        self.assertEqual({after[question_id] for question_id in moved}, {'votes3'})
+
+    @override_settings(POLLS_VOTE_SHARDS=['votes1'])
+    def test_only_vote_tables_on_shards(self):
+        """Only the votes and rollups are migrated on a shard."""
+        router = VoteShardRouter()
+        self.assertTrue(router.allow_migrate('votes1', 'polls', 'vote'))
+        self.assertTrue(router.allow_migrate('votes1', 'polls', 'voterollup'))
+        self.assertFalse(router.allow_migrate('votes1', 'polls', 'question'))
+        self.assertFalse(router.allow_migrate('votes1', 'auth', 'user'))
+        self.assertIsNone(router.allow_migrate('default', 'polls', 'question'))
+
+
+SHARDS = ['shard_test1', 'shard_test2']
+
+
+@override_settings(POLLS_VOTE_SHARDS=SHARDS, POLLS_RATE_LIMITS={})
+class ShardedVoteTests(TestCase):
+    """A class for checking that votes are written to and read from the shard of their question."""
+
+    @classmethod
+    def setUpClass(cls):
+        # The shards are added after the test case guards its databases, so they are
+        # cleaned by tearDown rather than by the test transaction.
+        super().setUpClass()
+        cls.paths = []
+        for alias in SHARDS:
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            cls.paths.append(path)
+            connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias, path in zip(SHARDS, cls.paths):
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+            os.remove(path)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        eligibility_cache.clear()
+        self.user = User.objects.create_user(username='voter', password='secret')
+        self.client.login(username='voter', password='secret')
+        self.questions = {}
+        while len(self.questions) < len(SHARDS):
+            question = create_question(question_text="Sharded question.", days=-1)
+            Choice.objects.create(question=question, choice_text="Yes")
+            Choice.objects.create(question=question, choice_text="No")
+            self.questions.setdefault(shard_for(question.pk), question)
+        self.question = self.questions[SHARDS[0]]
+        self.yes, self.no = self.question.choice_set.order_by('pk')
+
+    def tearDown(self):
+        for alias in SHARDS:
+            Vote.objects.using(alias).all().delete()
+            VoteRollup.objects.using(alias).all().delete()
+
+    def vote(self, question, choice):
+        return self.client.post(reverse('polls:vote', args=(question.pk,)), {'choice': choice.pk})
+
+    def test_vote_written_to_its_shard(self):
+        """A vote is stored on the shard of its question only, and the primary tallies are not touched."""
+        self.vote(self.question, self.yes)
+        self.assertEqual(Vote.objects.using(SHARDS[0]).filter(question=self.question).count(), 1)
+        self.assertFalse(Vote.objects.using(SHARDS[1]).exists())
+        self.assertFalse(Vote.objects.exists())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_count, 0)
+
+    def test_detail_shows_vote_from_shard(self):
+        """The detail page reads the vote of the user from the shard."""
+        self.vote(self.question, self.no)
+        response = self.client.get(reverse('polls:detail', args=(self.question.pk,)))
+        self.assertEqual(response.context['voted_choice'], self.no.pk)
+
+    def test_results_read_one_shard(self):
+        """The results are summed from the rollups of the shard of the question, without asking the other one."""
+        self.vote(self.question, self.yes)
+        self.vote(self.question, self.no)
+        cache.clear()
+        with CaptureQueriesContext(connections[SHARDS[0]]) as owner, \
+                CaptureQueriesContext(connections[SHARDS[1]]) as other:
+            snapshot = get_results_snapshot(self.question.pk)
+        self.assertEqual([choice['vote_count'] for choice in snapshot['choices']], [0, 1])
+        self.assertEqual(snapshot['question']['vote_count'], 1)
+        self.assertEqual(len(owner.captured_queries), 1)
+        self.assertEqual(len(other.captured_queries), 0)
+
+    def test_batch_spans_shards(self):
+        """A batch of queued votes is split by shard."""
+        other = self.questions[SHARDS[1]]
+        touched = Vote.objects.cast_many({(self.user.pk, self.question.pk): self.yes.pk,
+                                          (self.user.pk, other.pk): other.choice_set.first().pk})
+        self.assertEqual(touched, {self.question.pk, other.pk})
+        for alias, question in self.questions.items():
+            self.assertEqual(VoteRollup.objects.tallies(question.pk), {question.choice_set.first().pk: 1})
+            self.assertTrue(Vote.objects.using(alias).filter(question=question).exists())
+
+    def test_rebuild_tallies_counts_shards(self):
+        """rebuild_tallies refreshes the primary tallies from the votes on the shards."""
+        self.vote(self.question, self.yes)
+        call_command('rebuild_tallies', stdout=StringIO())
+        self.yes.refresh_from_db()
+        self.assertEqual(self.yes.vote_count, 1)
+
+    def test_delete_question_deletes_shard_votes(self):
+        """Deleting a question deletes its votes and rollups on its shard."""
+        self.vote(self.question, self.yes)
+        self.question.delete()
+        self.assertFalse(Vote.objects.using(SHARDS[0]).exists())
+        self.assertFalse(VoteRollup.objects.using(SHARDS[0]).exists())
+
+    def test_delete_user_leaves_shard_results(self):
+        """Deleting a user deletes their votes on the shards and takes them out of the results."""
+        self.vote(self.question, self.yes)
+        other = self.questions[SHARDS[1]]
+        self.vote(other, other.choice_set.first())
+        self.assertEqual(get_results_snapshot(self.question.pk)['question']['vote_count'], 1)
+        self.user.delete()
+        for alias, question in self.questions.items():
+            self.assertFalse(Vote.objects.using(alias).exists())
+            self.assertEqual(get_results_snapshot(question.pk)['question']['vote_count'], 0)
+
+    def test_rebalance_moves_votes_from_primary(self):
+        """Votes cast before sharding move to their shards with their timestamps, and the results stay the same."""
+        voted_at = timezone.now() - datetime.timedelta(days=1)
+        with override_settings(POLLS_VOTE_SHARDS=[]):
+            Vote.objects.cast(self.user.pk, self.question.pk, self.yes.pk)
+            Vote.objects.update(created=voted_at, updated=voted_at)
+        call_command('rebalance_votes', stdout=StringIO())
+        self.assertFalse(Vote.objects.exists())
+        self.assertFalse(VoteRollup.objects.exists())
+        vote = Vote.objects.using(SHARDS[0]).get()
+        self.assertEqual((vote.user_id, vote.choice_id, vote.updated), (self.user.pk, self.yes.pk, voted_at))
+        self.assertEqual(VoteRollup.objects.tallies(self.question.pk), {self.yes.pk: 1})
+
+    def test_rebalance_keeps_newer_vote(self):
+        """A vote cast on the shard before the old vote moved wins, and the old one leaves the rollup."""
+        with override_settings(POLLS_VOTE_SHARDS=[]):
+            Vote.objects.cast(self.user.pk, self.question.pk, self.yes.pk)
+        Vote.objects.cast(self.user.pk, self.question.pk, self.no.pk)
+        output = StringIO()
+        call_command('rebalance_votes', stdout=output)
+        self.assertIn("dropped 1 votes", output.getvalue())
+        self.assertEqual(Vote.objects.using(SHARDS[0]).get().choice_id, self.no.pk)
+        tallies = VoteRollup.objects.tallies(self.question.pk)
+        self.assertEqual((tallies.get(self.yes.pk), tallies.get(self.no.pk)), (0, 1))
+
+    def test_foreign_keys_only_on_primary(self):
+        """The primary checks the keys of the votes and rollups; the shards, without the referenced tables, do not."""
+        for table in [Vote._meta.db_table, VoteRollup._meta.db_table]:
+            foreign_keys = {}
+            for alias in [DEFAULT_DB_ALIAS, *SHARDS]:
+                connection = connections[alias]
+                with connection.cursor() as cursor:
+                    constraints = connection.introspection.get_constraints(cursor, table)
+                foreign_keys[alias] = [name for name, constraint in constraints.items() if constraint['foreign_key']]
+            self.assertTrue(foreign_keys[DEFAULT_DB_ALIAS])
+            self.assertEqual([foreign_keys[alias] for alias in SHARDS], [[], []])
+
+    def test_vote_counts_read_from_shards(self):
+        """The index JSON, the admin changelist and the export sum the vote counts from the shards."""
+        self.vote(self.question, self.yes)
+        response = self.client.get(reverse('polls:index_json'))
+        counts = {question['id']: question['vote_count'] for question in response.json()['questions']}
+        self.assertEqual(counts[self.question.pk], 1)
+        self.client.force_login(User.objects.create_superuser(username='admin', password='secret'))
+        response = self.client.get(reverse('admin:polls_question_changelist'))
+        listed = {question.pk: question.vote_count for question in response.context['cl'].result_list}
+        self.assertEqual(listed[self.question.pk], 1)
+        self.assertNotIn('total_votes', response.context['cl'].sortable_by)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'polls.jsonl')
+            call_command('export_polls', path, stderr=StringIO())
+            with open(path) as export:
+                exported = {record['id']: record['vote_count'] for record in map(json.loads, export)}
+        self.assertEqual(exported[self.question.pk], 1)
@@ -0,0 +1,40 @@
+"""Module for testing the SQLite connection profile."""
+import tempfile
+import unittest
+from pathlib import Path
+
+from django.db import connection, connections
+from django.test import SimpleTestCase, override_settings
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "The profile only applies to SQLite.")
+class SqliteProfileTests(SimpleTestCase):
+    """A class for checking that the pragmas are applied to new connections."""
+
+    def connect(self):
+        """Open a new connection to a temporary SQLite file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {**connection.settings_dict, 'NAME': str(Path(directory.name) / 'profile.sqlite3')}
+        wrapper = type(connections['default'])(settings_dict, alias='profile')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    @override_settings(POLLS_SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234})
+    def test_pragmas_applied(self):
+        """A new connection gets the configured pragmas."""
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+
+    @override_settings(POLLS_SQLITE_PRAGMAS={})
+    def test_no_profile(self):
+        """Without the profile SQLite keeps its defaults."""
+        self.assertEqual(self.pragma(self.connect(), 'journal_mode'), 'delete')
@@ -0,0 +1,23 @@
+"""Module for testing the template cache warm-up."""
+import unittest
+
+from django.conf import settings
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import SimpleTestCase
+
+from polls.warmup import warm_templates
+
+
+@unittest.skipUnless(settings.POLLS_TEMPLATE_CACHE, "The cached loader is only used with POLLS_TEMPLATE_CACHE.")
+class TemplateWarmupTests(SimpleTestCase):
+    """A class for checking that the polls templates are compiled ahead of the first request."""
+
+    def test_warm_templates(self):
+        """Every polls template is compiled into the cached loader."""
+        names = warm_templates()
+        self.assertIn('polls/question_list.html', names)
+        self.assertIn('polls/results.html', names)
+        loader = engines.all()[0].engine.template_loaders[0]
+        self.assertIsInstance(loader, CachedLoader)
+        self.assertTrue(set(names) <= set(loader.get_template_cache))
@@ -0,0 +1,65 @@
+"""Module for testing vote timestamps, the rollup and the turnout view."""
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Vote, VoteRollup
+from polls.tests.test_detail_view import create_question
+
+
+class TurnoutTests(TestCase):
+    """A class for checking the rollup maintained by the vote path and the turnout view."""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'voter{i}') for i in range(3)]
+        self.question = create_question(question_text="Turnout question.", days=-1)
+        self.first = Choice.objects.create(question=self.question, choice_text="First")
+        self.second = Choice.objects.create(question=self.question, choice_text="Second")
+
+    def test_vote_timestamps(self):
+        """A vote keeps when it was created and when it was last changed."""
+        Vote.objects.cast(self.users[0].id, self.question.id, self.first.id)
+        vote = Vote.objects.get()
+        self.assertEqual(vote.created, vote.updated)
+        Vote.objects.cast(self.users[0].id, self.question.id, self.second.id)
+        vote.refresh_from_db()
+        self.assertGreater(vote.updated, vote.created)
+
+    def test_rollup_follows_votes(self):
+        """New and changed votes add their net change to the rollup of the minute."""
+        Vote.objects.cast(self.users[0].id, self.question.id, self.first.id)
+        Vote.objects.cast(self.users[1].id, self.question.id, self.first.id)
+        Vote.objects.cast(self.users[0].id, self.question.id, self.second.id)
+        Vote.objects.cast_many({(self.users[2].id, self.question.id): self.second.id})
+        counts = dict(VoteRollup.objects.values_list('choice_id', 'count'))
+        self.assertEqual(counts, {self.first.id: 1, self.second.id: 2})
+
+    def test_turnout_reads_only_the_rollup(self):
+        """The turnout view answers from the rollup, whatever the number of votes."""
+        for user in self.users:
+            Vote.objects.cast(user.id, self.question.id, self.first.id)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('polls:turnout_json', args=(self.question.id,)))
+        series = response.json()['series']
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]['votes'], 3)
+        self.assertEqual(series[0]['choices'], {str(self.first.id): 3})
+
+    def test_turnout_bucket(self):
+        """Only minute, hour and day buckets are accepted."""
+        url = reverse('polls:turnout_json', args=(self.question.id,))
+        self.assertEqual(self.client.get(url, {'bucket': 'hour'}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'bucket': 'week'}).status_code, 400)
+
+    def test_compact_rollups(self):
+        """Old minute rows are merged into one row per hour without changing the totals."""
+        hour = (timezone.now() - datetime.timedelta(days=10)).replace(minute=0, second=0, microsecond=0)
+        for minute, count in ((1, 2), (30, 3), (59, -1)):
+            VoteRollup.objects.add({(self.question.id, self.first.id): count}, hour.replace(minute=minute))
+        call_command('compact_rollups', stdout=StringIO())
+        self.assertEqual(list(VoteRollup.objects.values_list('minute', 'count')), [(hour, 4)])
@@ -0,0 +1,124 @@
+"""Module for testing the write-behind vote queue."""
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls import ingest
+from polls.ingest import VoteFlusher, VoteQueue
+from polls.models import Choice, Vote
+from polls.tests.test_detail_view import create_question
+
+
+class VoteQueueTests(TestCase):
+    """A class for checking the queue and the batched flushes."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue = VoteQueue(Path(directory.name) / 'queue.sqlite3')
+        self.flusher = VoteFlusher(self.queue, interval=60, batch_size=2)
+        self.users = [User.objects.create_user(username=f'voter{i}') for i in range(3)]
+        self.question = create_question(question_text="Queued question.", days=-1)
+        self.first = Choice.objects.create(question=self.question, choice_text="First")
+        self.second = Choice.objects.create(question=self.question, choice_text="Second")
+
+    def put(self, user, choice):
+        self.queue.put(user.id, self.question.id, choice.id)
+
+    def test_put_does_not_write_votes(self):
+        """Queued votes wait in the queue until a flush."""
+        self.put(self.users[0], self.first)
+        self.assertEqual(self.queue.depth(), 1)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_drain_applies_batches(self):
+        """Draining applies every batch and updates the tallies."""
+        for user in self.users:
+            self.put(user, self.first)
+        self.flusher.drain()
+        self.assertEqual(self.queue.depth(), 0)
+        self.first.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.question.vote_count, self.first.vote_count), (3, 3))
+        self.assertEqual(self.flusher.stats()['batches'], 2)
+
+    def test_last_write_wins(self):
+        """The last queued vote of a user on a question is the one that is kept."""
+        Vote.objects.cast(self.users[0].id, self.question.id, self.first.id)
+        self.put(self.users[0], self.second)
+        self.put(self.users[0], self.first)
+        self.put(self.users[0], self.second)
+        self.flusher.drain()
+        self.assertEqual(Vote.objects.get(user=self.users[0]).choice_id, self.second.id)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.vote_count, self.second.vote_count), (0, 1))
+
+    def test_one_live_claim(self):
+        """A second flusher waits while another one holds a claim, and takes over a stale one."""
+        self.put(self.users[0], self.first)
+        token, rows = self.queue.claim(10)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(self.queue.claim(10)[1], [])
+        self.queue.claim_timeout = -1
+        self.assertEqual(len(self.queue.claim(10)[1]), 1)
+
+    def test_failed_flush_releases_claim(self):
+        """Votes of a batch that could not be applied stay in the queue."""
+        self.put(self.users[0], self.first)
+        with mock.patch.object(Vote.objects, 'cast_many', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.flusher.flush()
+        self.assertEqual(self.flusher.flush(), 1)
+
+    def test_logs_stats(self):
+        """The stats are logged as one JSON line once every stats interval."""
+        self.put(self.users[0], self.first)
+        self.flusher.drain()
+        self.flusher.stats_interval = 0
+        with self.assertLogs('polls.ingest', 'INFO') as logs:
+            self.flusher.log_if_due()
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['event'], entry['flushed'], entry['queue_depth']), ('vote_queue_stats', 1, 0))
+        self.flusher.stats_interval = 60
+        with self.assertNoLogs('polls.ingest', 'INFO'):
+            self.flusher.log_if_due()
+
+
+class QueuedVoteViewTests(TestCase):
+    """A class for checking the vote view in queue mode."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.flusher = VoteFlusher(VoteQueue(Path(directory.name) / 'queue.sqlite3'), interval=60, batch_size=10)
+        patcher = mock.patch.object(ingest, '_flusher', self.flusher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User.objects.create_user(username='voter', password='qwerxhucj12')
+        self.client.login(username='voter', password='qwerxhucj12')
+        self.question = create_question(question_text="Queued question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Only")
+
+    @override_settings(POLLS_VOTE_QUEUE=True)
+    def test_vote_is_queued(self):
+        """In queue mode a vote is validated, queued, and written by the next flush."""
+        response = self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(self.flusher.queue.depth(), 1)
+        self.assertFalse(Vote.objects.exists())
+        self.flusher.drain()
+        self.assertEqual(Vote.objects.get().choice_id, self.choice.id)
+
+    def test_metrics_include_queue(self):
+        """Staff see the stats of the flusher of the process in the metrics."""
+        User.objects.create_user(username='admin', password='qwerxhucj12', is_staff=True)
+        self.client.login(username='admin', password='qwerxhucj12')
+        self.flusher.queue.put(1, self.question.id, self.choice.id)
+        response = self.client.get(reverse('polls:metrics'))
+        self.assertEqual(response.json()['vote_queue']['queue_depth'], 1)
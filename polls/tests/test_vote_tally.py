@@ -0,0 +1,149 @@
+"""Module for testing the vote tallies."""
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection, IntegrityError, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls.eligibility import eligibility_cache
+from polls.models import Question, Choice, Vote, VoteRollup
+from polls.tests.test_detail_view import create_question
+
+
+class VoteTallyTests(TestCase):
+    """A class for checking that the tallies follow the votes."""
+
+    def setUp(self):
+        cache.clear()
+        eligibility_cache.clear()
+        self.user = User.objects.create_user(username='voter', password='qwerxhucj12')
+        self.question = create_question(question_text="Tally question.", days=-1)
+        self.first = Choice.objects.create(question=self.question, choice_text="First")
+        self.second = Choice.objects.create(question=self.question, choice_text="Second")
+        self.client.login(username='voter', password='qwerxhucj12')
+
+    def vote(self, choice):
+        return self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def assertTallies(self, question, first, second):
+        self.question.refresh_from_db()
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.question.vote_count, self.first.vote_count, self.second.vote_count),
+                         (question, first, second))
+
+    def test_first_vote_counts_once(self):
+        """A new vote adds one to the choice and to the question."""
+        self.vote(self.first)
+        self.assertTallies(1, 1, 0)
+
+    def test_same_vote_twice(self):
+        """Voting for the same choice again does not change the tallies."""
+        self.vote(self.first)
+        self.vote(self.first)
+        self.assertTallies(1, 1, 0)
+
+    def test_changed_vote_moves_tally(self):
+        """Changing a vote takes one from the old choice and gives it to the new one."""
+        self.vote(self.first)
+        self.vote(self.second)
+        self.assertTallies(1, 0, 1)
+        self.assertEqual(Vote.objects.filter(question=self.question).count(), 1)
+
+    def test_deleted_voter_leaves_tallies(self):
+        """Deleting a voter deletes the vote and takes it out of the tallies and the rollup."""
+        self.vote(self.first)
+        self.user.delete()
+        self.assertTallies(0, 0, 0)
+        self.assertEqual(VoteRollup.objects.tallies(self.question.pk), {self.first.pk: 0})
+        call_command('rebuild_tallies', check=True, stdout=StringIO())
+
+    def test_deleted_choice_leaves_question_tally(self):
+        """Deleting a choice takes its votes out of the question tally."""
+        self.vote(self.first)
+        self.first.delete()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_count, 0)
+        call_command('rebuild_tallies', check=True, stdout=StringIO())
+
+    def test_deleted_question_costs_same_queries(self):
+        """Deleting a question deletes its votes in bulk, however many there are, without untallying them."""
+        counts = []
+        for voters in (2, 20):
+            question = create_question(question_text="Archived question.", days=-1)
+            choice = Choice.objects.create(question=question, choice_text="Only")
+            for number in range(voters):
+                user = User.objects.create_user(username=f'archived{voters}-{number}')
+                Vote.objects.cast(user.id, question.id, choice.id)
+            with CaptureQueriesContext(connection) as queries:
+                question.delete()
+            counts.append(len(queries))
+            self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+            self.assertFalse(Vote.objects.filter(question_id=question.pk).exists())
+        self.assertEqual(counts[0], counts[1])
+
+    def test_results_page_shows_tallies(self):
+        """The results page shows the tallies without counting the votes."""
+        self.vote(self.second)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, "<td>1</td>", count=1)
+
+
+class VoteUpsertTests(TestCase):
+    """A class for checking the upsert path of Vote.objects.cast."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='qwerxhucj12')
+        self.question = create_question(question_text="Upsert question.", days=-1)
+        self.first = Choice.objects.create(question=self.question, choice_text="First")
+        self.second = Choice.objects.create(question=self.question, choice_text="Second")
+
+    def test_one_vote_per_user_and_question(self):
+        """The database refuses a second Vote row for the same user and question."""
+        Vote.objects.create(user=self.user, question=self.question, choice=self.first)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user=self.user, question=self.question, choice=self.second)
+
+    def test_first_vote_is_one_statement(self):
+        """A first vote touches the Vote table with a single upsert statement."""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(Vote.objects.cast(self.user.id, self.question.id, self.first.id))
+        vote_queries = [query['sql'] for query in queries.captured_queries if '"polls_vote"' in query['sql']]
+        self.assertEqual(len(vote_queries), 1)
+        self.assertIn('ON CONFLICT', vote_queries[0])
+
+    def test_cast_returns_previous_choice(self):
+        """Casting again returns the previously selected choice and keeps one row."""
+        Vote.objects.cast(self.user.id, self.question.id, self.first.id)
+        self.assertEqual(Vote.objects.cast(self.user.id, self.question.id, self.second.id), self.first.id)
+        self.assertEqual(Vote.objects.get(user=self.user, question=self.question).choice_id, self.second.id)
+
+
+class RebuildTalliesCommandTests(TestCase):
+    """A class for checking the rebuild_tallies command."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='voter', password='qwerxhucj12')
+        self.question = create_question(question_text="Tally question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Only")
+        Vote.objects.create(user=user, question=self.question, choice=self.choice)
+
+    def test_check_reports_mismatch(self):
+        """--check fails without touching the tallies when they do not match."""
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tallies', check=True, stdout=StringIO())
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.vote_count, 0)
+
+    def test_rebuild_fixes_tallies(self):
+        """The command recounts the tallies from the votes."""
+        call_command('rebuild_tallies', stdout=StringIO())
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.vote_count, 1)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).vote_count, 1)
+        call_command('rebuild_tallies', check=True, stdout=StringIO())
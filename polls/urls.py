@@ -2,17 +2,24 @@
 from django.urls import path
 from . import views
 from django.contrib.auth.decorators import login_required
+from .ratelimit import rate_limit
 
 
 app_name = 'polls'
 urlpatterns = [
     # path('', views.IndexView.as_view(), name='index'),
     path('', views.index_view, name='index'),
+    path('index.json', views.index_json, name='index_json'),
     # path('<int:pk>/', login_required(views.DetailView.as_view()), name='detail'),
     path('<int:pk>/', login_required(views.detail_view), name='detail'),
     path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+    path('<int:pk>/results.json', views.results_json, name='results_json'),
+    path('<int:pk>/results.csv', views.results_csv, name='results_csv'),
+    path('<int:pk>/turnout.json', views.turnout_json, name='turnout_json'),
+    # <int:pk>/results/stream/ is served by polls.streams when running under ASGI.
     # path('<int:pk>/results/', views.result_view, name='results'),
-    path('<int:question_id>/vote/', login_required(views.can_access), name='vote'),
+    path('<int:question_id>/vote/', rate_limit('vote')(login_required(views.can_access)), name='vote'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
     # path('login/', views.user_login, name='login'),
     # path('register/', views.user_register, name='register'),
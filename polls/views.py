@@ -1,23 +1,32 @@
 """Controlling the flow of the application."""
+import csv
+import itertools
+
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
-from django.http import HttpResponseRedirect
+from django.contrib.auth.models import User
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from django.views import generic
-from django.utils import timezone
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Trunc
 from django.http import Http404
-from django.contrib.auth import user_logged_in, user_logged_out, user_login_failed, authenticate, login
-from .models import Question, Choice, Vote
-from django.dispatch import receiver
-import logging
-
-logger = logging.getLogger(__name__)
-formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s:%(message)s')
-handler = logging.StreamHandler()
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+from django.contrib.auth import authenticate, login
+from .cache import get_ballot, get_index_fragment, get_results_snapshot, snapshot_etag, update_results_snapshot
+from .audit import audit, audit_stats
+from .eligibility import eligibility_cache
+from .ingest import enqueue_vote, vote_flusher_stats
+from .metrics import registry
+from .models import Question, Vote, VoteRollup
+from .pagination import KeysetPage
+from .routers import pin_to_primary, replica_view
+from .shards import is_sharded
 
 
 # class IndexView(generic.ListView):
@@ -36,6 +45,7 @@ logger.setLevel(logging.INFO)
 #         return Question.objects.filter(pub_date__lte=timezone.now()).order_by('-pub_date')
 
 
+@replica_view
 def index_view(request):
     """
     Creating index page
@@ -47,11 +57,43 @@ def index_view(request):
         Polls index page
 
     """
-    context = {'question_list': Question.objects.filter(pub_date__lte=timezone.now()).order_by('-pub_date'),
+    try:
+        question_list = KeysetPage(Question.objects.open(), request.GET.get('cursor', ''),
+                                   settings.POLLS_INDEX_PAGE_SIZE)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    context = {'question_list': question_list,
+               'question_list_html': get_index_fragment(question_list),
                }
     return render(request, 'polls/index.html', context)
 
 
+@replica_view
+def index_json(request):
+    """
+    List the open polls as JSON, a page at a time.
+
+    Arguments:
+        request: user's request, with the cursor of the page if it is not the first one.
+
+    Returns:
+        JSON of the questions of the page and the cursor of the next page, or null on the last page.
+    """
+    try:
+        page = KeysetPage(Question.objects.open().only('question_text', 'pub_date', 'end_date', 'vote_count'),
+                          request.GET.get('cursor', ''), settings.POLLS_INDEX_PAGE_SIZE)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    if is_sharded():
+        totals = VoteRollup.objects.totals([question.pk for question in page])
+        for question in page:
+            question.vote_count = totals.get(question.pk, 0)
+    questions = [{'id': question.pk, 'question_text': question.question_text,
+                  'pub_date': question.pub_date.isoformat(), 'end_date': question.end_date.isoformat(),
+                  'vote_count': question.vote_count} for question in page]
+    return JsonResponse({'questions': questions, 'next': page.next_cursor})
+
+
 # class DetailView(generic.DetailView):
 #     """A class for creating detail view page."""
 #     model = Question
@@ -66,6 +108,13 @@ def index_view(request):
 #         """
 #         return Question.objects.filter(pub_date__lte=timezone.now())
 
+def ballot_choices(question):
+    """Get the choices of a question from its cached ballot, as dicts with an id and a choice_text."""
+    ballot = get_ballot(question.pk, question)
+    return [{'id': choice_id, 'choice_text': text} for choice_id, text in ballot['choices']]
+
+
+@replica_view
 def detail_view(request, pk):
     """
     Creating detail page
@@ -77,15 +126,17 @@ def detail_view(request, pk):
     Return:
         Polls detail page
     """
-    question = Question.objects.get(pk=pk)
+    if is_sharded():
+        question = get_object_or_404(Question.objects.with_status(), pk=pk)
+        voted_choice = Vote.objects.choice_of(request.user.id, pk) if question.is_open else None
+    else:
+        vote = Vote.objects.filter(question=OuterRef('pk'), user_id=request.user.id).values('choice_id')[:1]
+        question = get_object_or_404(Question.objects.with_status().annotate(voted_choice=Subquery(vote)), pk=pk)
+        voted_choice = question.voted_choice
     try:
-        if question.can_vote():
-            vote_choice = Vote.objects.filter(user_id=request.user.id, question_id=question.id).exists()
-            if vote_choice:
-                vote_choice = Vote.objects.get(user_id=request.user.id, question_id=question.id)
-                context = {'question': question, 'voted_choice': vote_choice.choice_id}
-            else:
-                context = {'question': question, 'voted_choice': None}
+        if question.is_open:
+            context = {'question': question, 'choices': ballot_choices(question),
+                       'voted_choice': voted_choice}
             return render(request, "polls/detail.html", context)
         else:
             raise Http404("This question is not in the polling period")
@@ -94,35 +145,179 @@ def detail_view(request, pk):
         return HttpResponseRedirect(reverse('polls:index'))
 
 
+@method_decorator(replica_view, name='dispatch')
 class ResultsView(generic.DetailView):
     """A class for creating result page."""
 
     model = Question
     template_name = "polls/results.html"
 
+    def get(self, request, *args, **kwargs):
+        """
+        Render the results from the cached snapshot, or answer 304 if the client has them already.
+
+        Returns:
+            Result page with ETag and Last-Modified headers.
+        """
+        snapshot = get_results_snapshot(kwargs['pk'])
+        if snapshot is None:
+            raise Http404("No question found matching the query")
+        etag = snapshot_etag(snapshot)
+        last_modified = int(snapshot['modified'])
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render(request, self.template_name, snapshot)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if snapshot['closed']:
+            patch_cache_control(response, public=True, max_age=settings.POLLS_RESULTS_CACHE_TIMEOUT)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+def results_json(request, pk):
+    """
+    Give the results of a poll as JSON.
+
+    Arguments:
+        request: user's request
+        pk: id of question to look for
+
+    Returns:
+        The question, its choices with their tallies and whether the poll is closed.
+    """
+    snapshot = get_results_snapshot(pk)
+    if snapshot is None:
+        raise Http404("No question found matching the query")
+    etag = snapshot_etag(snapshot)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(snapshot)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@replica_view
+def turnout_json(request, pk):
+    """
+    Give the votes of a poll over time, read only from the per-minute rollup.
+
+    Arguments:
+        request: user's request, with bucket=minute, hour or day (minute by default).
+        pk: id of question to look for
+
+    Returns:
+        JSON with one entry per bucket: the net change of each choice and of the total.
+    """
+    bucket = request.GET.get('bucket', 'minute')
+    if bucket not in ('minute', 'hour', 'day'):
+        return JsonResponse({'error': "bucket must be minute, hour or day"}, status=400)
+    if not Question.objects.filter(pk=pk).exists():
+        raise Http404("No question found matching the query")
+    rows = (VoteRollup.objects.for_question(pk).annotate(time=Trunc('minute', bucket))
+            .values_list('time', 'choice_id').annotate(votes=Sum('count')).order_by('time', 'choice_id'))
+    series = []
+    for time, choice_id, votes in rows:
+        if not series or series[-1]['time'] != time.isoformat():
+            series.append({'time': time.isoformat(), 'votes': 0, 'choices': {}})
+        series[-1]['votes'] += votes
+        series[-1]['choices'][choice_id] = votes
+    return JsonResponse({'question': pk, 'bucket': bucket, 'series': series})
+
+
+class Echo:
+    """A file-like object that gives back what is written, for csv.writer in streaming responses."""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(question, include_votes, chunk_size=2000):
+    """
+    Give the CSV lines of the results of a question, a chunk of lines at a time.
+
+    Yields:
+        str: CSV lines of the tallies, then of the raw votes if requested.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(['choice_id', 'choice_text', 'votes'])
+    choices = list(question.choice_set.order_by('pk').values_list('pk', 'choice_text', 'vote_count'))
+    if is_sharded():
+        tallies = VoteRollup.objects.tallies(question.pk)
+        choices = [(pk, text, tallies.get(pk, 0)) for pk, text, _ in choices]
+    for row in choices:
+        yield writer.writerow(row)
+    if not include_votes:
+        return
+    yield writer.writerow([])
+    yield writer.writerow(['username', 'choice_id', 'choice_text', 'voted_at'])
+    # The votes may live on a shard, so the usernames and choice texts are looked up apart.
+    choice_texts = {pk: text for pk, text, _ in choices}
+    votes = (Vote.objects.for_question(question.pk).order_by().values_list('user_id', 'choice_id', 'updated')
+             .iterator(chunk_size=chunk_size))
+    for chunk in iter(lambda: list(itertools.islice(votes, chunk_size)), []):
+        usernames = dict(User.objects.filter(pk__in={user_id for user_id, _, _ in chunk})
+                         .values_list('pk', 'username'))
+        yield ''.join(writer.writerow([usernames.get(user_id), choice_id, choice_texts.get(choice_id),
+                                       updated.isoformat()]) for user_id, choice_id, updated in chunk)
+
+
+@staff_member_required
+def results_csv(request, pk):
+    """
+    Download the results of a poll as CSV, for staff.
+
+    The votes are read with a chunked iterator and streamed, so a poll with millions of
+    votes downloads in constant memory.
+
+    Arguments:
+        request: user's request, with votes=1 to add the raw votes.
+        pk: id of question to look for
+
+    Returns:
+        Streaming CSV of the tallies, and of the raw votes if requested.
+    """
+    question = get_object_or_404(Question, pk=pk)
+    response = StreamingHttpResponse(csv_rows(question, request.GET.get('votes') == '1'), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="poll-{question.pk}-results.csv"'
+    return response
+
 
 # def result_view(request):
 #     # context = {}
 #     return render(request, "polls/results.html")
 
 
-def vote(request, question_id):
+def vote(request, question_id, eligibility=None):
     """
     Vote a choice in the poll.
 
+    The choice is checked against the cached choice ids of the question, so a valid
+    vote reads nothing before it is written.
+
     Arguments:
         request: user's request
         question_id: the id of question that user requested.
+        eligibility: the Eligibility of the question, if the caller has it already.
 
     Returns:
         Detail page if the choice is not selected. Else, the result page of that question.
     """
-    question = get_object_or_404(Question, pk=question_id)
+    if eligibility is None:
+        eligibility = eligibility_cache.get(question_id)
+        if eligibility is None:
+            raise Http404("No question found matching the query")
     try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+        choice_id = int(request.POST['choice'])
+    except (KeyError, ValueError):
+        choice_id = None
+    if choice_id not in eligibility.choice_ids:
+        question = get_object_or_404(Question, pk=question_id)
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': ballot_choices(question),
             'error_message': "You didn't select a choice.",
         })
     else:
@@ -137,16 +332,17 @@ def vote(request, question_id):
         #     user.vote_set.add(request.POST['choice'])
         # finally:
         #     return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
-        user_id = request.user.id
-        try:
-            vote_choice = Vote.objects.get(user_id=user_id, question_id=question_id)
-            vote_choice.choice_id = selected_choice.id
-            vote_choice.save()
-        except Vote.DoesNotExist:
-            vote_choice = Vote.objects.create(user_id=user_id, choice_id=selected_choice.id, question_id=question_id)
-            vote_choice.save()
-        finally:
-            return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+        if settings.POLLS_VOTE_QUEUE:
+            enqueue_vote(request.user.id, question_id, choice_id)
+            audit('vote', request, user_id=request.user.id, question_id=question_id, choice_id=choice_id,
+                  queued=True)
+        else:
+            previous_choice_id = Vote.objects.cast(request.user.id, question_id, choice_id)
+            update_results_snapshot(question_id, previous_choice_id, choice_id)
+            audit('vote', request, user_id=request.user.id, question_id=question_id, choice_id=choice_id,
+                  previous_choice_id=previous_choice_id)
+        pin_to_primary(request)
+        return HttpResponseRedirect(reverse('polls:results', args=(question_id,)))
 
 
 def can_access(request, question_id):
@@ -164,28 +360,33 @@ def can_access(request, question_id):
         Poll index page if the requested question is not in the polling period.
 
     """
-    question = get_object_or_404(Question, pk=question_id)
-    if not question.can_vote():
+    eligibility = eligibility_cache.get(question_id)
+    if eligibility is None:
+        raise Http404("No question found matching the query")
+    if not eligibility.can_vote():
         messages.error(request, f"The question is not in the polling period.")
         return redirect('polls:index')
     else:
-        return vote(request, question_id)
+        return vote(request, question_id, eligibility)
 
 
-@receiver(user_logged_out)
-def user_logout(request, **kwargs):
-    logger.info(f"{request.user.username} logged out, IP: {request.META.get('REMOTE_ADDR')}")
+@staff_member_required
+def metrics_view(request):
+    """
+    Give the aggregated request metrics of this process to staff.
 
+    Arguments:
+        request: user's request
 
-@receiver(user_logged_in)
-def user_login(request, **kwargs):
-    logger.info(f"{request.user.username} logged in, IP: {request.META.get('REMOTE_ADDR')}")
+    Returns:
+        JSON of the per-view request counts, histograms and totals, the cache and audit log counters,
+        and the vote queue stats, null while no vote was queued in this process.
+    """
+    return JsonResponse({'views': registry.snapshot(), 'eligibility_cache': eligibility_cache.stats(),
+                         'audit_log': audit_stats(), 'vote_queue': vote_flusher_stats()})
 
 
-@receiver(user_login_failed)
-def user_login(request, **kwargs):
-    username = request.POST['username']
-    logger.warning(f"warning: {username} logged in failed, IP: {request.META.get('REMOTE_ADDR')}")
+# Logins, logouts and failed logins are recorded by the receivers in polls.audit.
 
 # def user_login(request):
 #     username = request.POST.get('username')
@@ -210,6 +411,7 @@ def signup(request):
             raw_passwd = form.cleaned_data.get('password')
             user = authenticate(username=username, password=raw_passwd)
             login(request, user)
+            pin_to_primary(request)
             return redirect('polls:index')
     else:
         form = UserCreationForm()
@@ -0,0 +1,111 @@
+"""Module for preparing the polls app and its caches before they serve requests."""
+import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Min, Q
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.utils import timezone
+
+from .cache import build_ballot, build_results_snapshot, bump_index_version, get_index_fragment
+from .models import Question
+from .pagination import KeysetPage
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+
+
+def warm_templates():
+    """
+    Compile every template of the polls app, so the cached loader holds them before the first request.
+
+    Returns:
+        list: the names of the templates compiled.
+    """
+    names = sorted(path.relative_to(TEMPLATE_DIR).as_posix() for path in TEMPLATE_DIR.rglob('*.html'))
+    for engine in engines.all():
+        if isinstance(engine, DjangoTemplates):
+            for name in names:
+                engine.get_template(name)
+    return names
+
+
+def warm_question(question_id):
+    """Put the ballot and the results of a question into the shared cache before it opens."""
+    build_ballot(question_id)
+    build_results_snapshot(question_id)
+
+
+def freeze_question(question_id):
+    """Store the final results of a closed question, which never expire."""
+    build_results_snapshot(question_id)
+
+
+def warm_index():
+    """Move the index to a new version and render its first page, so no visitor renders it after a boundary."""
+    bump_index_version()
+    get_index_fragment(KeysetPage(Question.objects.open(), '', settings.POLLS_INDEX_PAGE_SIZE))
+
+
+class PollScheduler:
+    """
+    Prepare the caches around the scheduled openings and closings of polls.
+
+    Each tick warms the ballot and empty results of the questions opening within `lead`
+    seconds, then handles the boundaries passed since the previous tick: the results of
+    a closed question are stored for good, and after any opening or closing the first
+    index page is rendered again. Only the shared cache is written; the in-process
+    eligibility caches of the web processes fill from the warmed ballots without queries.
+    """
+
+    def __init__(self, lead=None, interval=None):
+        """
+        Arguments:
+            lead: seconds before opening that a question is warmed, POLLS_PREWARM_LEAD by default.
+            interval: longest seconds between ticks, POLLS_PREWARM_INTERVAL by default.
+        """
+        self.lead = lead if lead is not None else settings.POLLS_PREWARM_LEAD
+        self.interval = interval if interval is not None else settings.POLLS_PREWARM_INTERVAL
+        self.last_tick = None
+        self.warmed = {}
+
+    def tick(self, now=None):
+        """
+        Warm the questions about to open and handle the boundaries passed since the last tick.
+
+        Arguments:
+            now: the time of the tick, the current time by default.
+
+        Returns:
+            dict: the ids of the questions warmed, opened and closed by this tick.
+        """
+        now = now or timezone.now()
+        since = self.last_tick or now - datetime.timedelta(seconds=self.interval)
+        warmed = []
+        opening = Question.objects.upcoming(now).filter(pub_date__lte=now + datetime.timedelta(seconds=self.lead))
+        for pk, pub_date in opening.values_list('pk', 'pub_date'):
+            if self.warmed.get(pk) != pub_date:
+                warm_question(pk)
+                self.warmed[pk] = pub_date
+                warmed.append(pk)
+        opened = list(Question.objects.filter(pub_date__gt=since, pub_date__lte=now).values_list('pk', flat=True))
+        closed = list(Question.objects.filter(end_date__gte=since, end_date__lt=now).values_list('pk', flat=True))
+        for pk in closed:
+            freeze_question(pk)
+        if opened or closed:
+            warm_index()
+        self.warmed = {pk: pub_date for pk, pub_date in self.warmed.items() if pub_date > now}
+        self.last_tick = now
+        return {'warmed': warmed, 'opened': opened, 'closed': closed}
+
+    def seconds_until_next_tick(self, now=None):
+        """Get how long to sleep: until the next opening or closing, but at most `interval` seconds."""
+        now = now or timezone.now()
+        boundaries = Question.objects.aggregate(next_pub=Min('pub_date', filter=Q(pub_date__gt=now)),
+                                                next_end=Min('end_date', filter=Q(end_date__gte=now)))
+        wait = self.interval
+        for boundary in boundaries.values():
+            if boundary is not None:
+                # A question closes once end_date has passed, so wake just after the boundary.
+                wait = min(wait, (boundary - now).total_seconds() + 0.001)
+        return max(0.0, wait)